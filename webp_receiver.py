@@ -14,7 +14,7 @@ import struct
 import threading
 import queue
 from collections import deque
-import hashlib
+import zlib
 import io
 from PIL import Image
 import socket
@@ -74,6 +74,21 @@ def select_wireless_speed():
         else:
             print("❌ Invalid choice, please enter 1-4")
 
+def select_wireless_transport():
+    """Select wireless transport protocol"""
+    print("\n📡 Please select wireless transport:")
+    print("1. TCP - Reliable stream (default)")
+    print("2. UDP - Lowest latency, lost packets are dropped frames")
+    
+    while True:
+        choice = input("Please enter choice (1 or 2, Enter for TCP): ").strip()
+        if choice in ('', '1'):
+            return 'tcp'
+        elif choice == '2':
+            return 'udp'
+        else:
+            print("❌ Invalid choice, please enter 1 or 2")
+
 # Default configuration (will be selected in main function)
 TRANSMISSION_MODE = 'uart'
 BAUD_RATE = 300000
@@ -81,10 +96,12 @@ BAUD_RATE = 300000
 # ==================== Configuration Parameters ====================
 # Serial port configuration (UART mode)
 RECEIVER_PORT = 'COM8'      # Receiver port (modify according to actual situation)
+UART_BUFFER_SIZE = 65536    # 驱动侧串口收发缓冲区大小 (仅Windows驱动支持设置)
 
 # Wireless configuration (wireless mode)
 WIRELESS_HOST = '127.0.0.1'  # Server IP (localhost for same computer testing)
 WIRELESS_PORT = 8888         # Wireless port
+WIRELESS_TRANSPORT = 'tcp'   # 无线传输层: 'tcp' 或 'udp' (UDP无队头阻塞，丢包即丢帧)
 
 # Connection role
 WIRELESS_ROLE = 'client'     # 接收端作为客户端
@@ -111,14 +128,45 @@ STATS_BUFFER_SIZE = 50      # Statistics buffer size
 # Advanced configuration (generally no need to modify)
 PROTOCOL_MAGIC = b'WP'      # 缩短魔术字节为2字节
 PACKET_TYPE = "WEBP"        # Packet type
+UDP_HELLO = b'WPHI'         # UDP模式下接收端发送的注册包
+UDP_STREAM_TIMEOUT = 1.0    # UDP模式下超过该时间 (秒) 没有数据报视为发送端已停止，重新发送注册包
+UDP_REORDER_WINDOW = 64     # 序列号回退不超过该值视为迟到的乱序包丢弃，回退更多视为发送端重启
 RECEIVE_TIMEOUT = 0.05      # Receive timeout
 
 # 优化协议设置
 USE_SIMPLIFIED_PROTOCOL = True  # 使用简化协议以减少开销
 # ================================================
 
+# 协议头格式 (预编译，必须与发送端一致)
+SIMPLE_HEADER = struct.Struct(f'<{len(PROTOCOL_MAGIC)}sH4s')    # Magic + Length + Hash
+FULL_HEADER = struct.Struct(f'<{len(PROTOCOL_MAGIC)}sII8s4s')   # Magic + FrameID + Length + Type + Hash
+HANDSHAKE_HEADER = struct.Struct(f'<{len(PROTOCOL_MAGIC)}s2sH') # Magic + 'HS' + Counter
+UDP_SEQ = struct.Struct('<I')                                   # UDP数据报序列号
+CRC32 = struct.Struct('<I')                                     # 帧数据CRC32校验值
+
+class RollingMean:
+    """Fixed-size sample window with an O(1) running mean"""
+    
+    def __init__(self, maxlen):
+        self._values = deque(maxlen=maxlen)
+        self._sum = 0.0
+    
+    def append(self, value):
+        # 窗口已满时先减去即将被挤出的最旧值
+        if len(self._values) == self._values.maxlen:
+            self._sum -= self._values[0]
+        self._values.append(value)
+        self._sum += value
+    
+    @property
+    def mean(self):
+        return self._sum / len(self._values) if self._values else 0.0
+    
+    def __len__(self):
+        return len(self._values)
+
 class WebPReceiver:
-    def __init__(self, transmission_mode=None, baud_rate=None):
+    def __init__(self, transmission_mode=None, baud_rate=None, wireless_transport=None):
         self.running = False
         
         # Transmission related
@@ -130,6 +178,9 @@ class WebPReceiver:
         
         # Wireless (wireless mode)
         self.wireless_socket = None
+        self.wireless_transport = wireless_transport or WIRELESS_TRANSPORT
+        self.udp_expected_seq = None  # UDP模式下期望的下一个序列号
+        self.udp_last_datagram_time = 0.0  # 最近一次收到数据报的时间 (单调时钟)
         
         # Hybrid mode
         self.handshake_thread = None
@@ -159,11 +210,13 @@ class WebPReceiver:
             'frames_displayed': 0,
             'bytes_received': 0,
             'errors': 0,
-            'compression_ratios': deque(maxlen=STATS_BUFFER_SIZE),
-            'packet_sizes': deque(maxlen=STATS_BUFFER_SIZE),
-            'fps_history': deque(maxlen=30),
+            'compression_ratios': RollingMean(STATS_BUFFER_SIZE),
+            'packet_sizes': RollingMean(STATS_BUFFER_SIZE),
+            'fps_history': RollingMean(5),  # 最近5秒的显示帧率 (统计输出)
+            'fps_recent': RollingMean(3),   # 最近3秒的显示帧率 (画面叠加信息)
             'handshakes_received': 0,
-            'frames_skipped': 0  # 新增：因handshake不活跃而跳过的帧数
+            'frames_skipped': 0,  # 新增：因handshake不活跃而跳过的帧数
+            'frames_lost': 0  # UDP模式下按序列号间隔统计的丢包数
         }
         
         # 性能优化标志
@@ -268,6 +321,12 @@ class WebPReceiver:
             self.ser_receiver.reset_input_buffer()
             self.ser_receiver.reset_output_buffer()
             
+            # 启用低延迟模式 (USB串口芯片延迟定时器 ~16ms → 1ms)
+            self._enable_low_latency()
+            
+            # 扩大驱动侧缓冲区，整帧数据可以一次交给驱动
+            self._set_driver_buffer_size()
+            
             print(f"✅ Receiver serial port initialization successful ({RECEIVER_PORT} @ {baud_rate}bps)")
             
             return True
@@ -276,23 +335,52 @@ class WebPReceiver:
             print(f"Please check if serial port {RECEIVER_PORT} is available")
             return False
     
+    def _set_driver_buffer_size(self):
+        """Enlarge the serial driver's RX/TX queues (Windows only)"""
+        # pyserial只在Windows上提供set_buffer_size (SetupComm)
+        if not hasattr(self.ser_receiver, 'set_buffer_size'):
+            return
+        try:
+            self.ser_receiver.set_buffer_size(rx_size=UART_BUFFER_SIZE, tx_size=UART_BUFFER_SIZE)
+            print(f"- Serial driver buffers: {UART_BUFFER_SIZE/1024:.0f}KB")
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Serial driver buffer size not supported: {e}")
+    
+    def _enable_low_latency(self):
+        """Enable ASYNC_LOW_LATENCY on the serial device (Linux only)"""
+        # pyserial只在Linux上提供set_low_latency_mode
+        if not hasattr(self.ser_receiver, 'set_low_latency_mode'):
+            return
+        try:
+            self.ser_receiver.set_low_latency_mode(True)
+            print("- Serial low-latency mode enabled")
+        except (ValueError, OSError) as e:
+            # 部分设备(如板载UART)不支持该设置，忽略即可
+            print(f"⚠️ Serial low-latency mode not supported: {e}")
+    
     def init_wireless(self):
         """Initialize wireless connection"""
+        if self.wireless_transport == 'udp':
+            return self._init_wireless_udp()
+        
         try:
             # 创建TCP客户端socket并进行优化
             self.wireless_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             
+            # 所有速率都设置接收缓冲区并禁用Nagle算法 (须在connect之前设置才能影响窗口大小)
+            # 设置更大的接收缓冲区
+            self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TCP_BUFFER_SIZE)
+            # 禁用Nagle算法，减少延迟
+            if TCP_NODELAY:
+                self.wireless_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print("🔧 Socket optimized for low-latency reception")
+            print(f"   - Receive buffer: {TCP_BUFFER_SIZE/1024:.0f}KB")
+            print(f"   - TCP_NODELAY: {TCP_NODELAY}")
+            
             # 优化socket配置 - 对于高性能模式
             if self.is_high_performance:
-                # 设置更大的接收缓冲区
-                self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TCP_BUFFER_SIZE)
-                # 禁用Nagle算法，减少延迟
-                self.wireless_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 # 设置超时
                 self.wireless_socket.settimeout(SOCKET_TIMEOUT)
-                print("🔧 Socket optimized for high performance")
-                print(f"   - Receive buffer: {TCP_BUFFER_SIZE/1024:.0f}KB")
-                print(f"   - TCP_NODELAY: {TCP_NODELAY}")
                 print(f"   - Timeout: {SOCKET_TIMEOUT*1000:.0f}ms")
             
             print(f"🌐 Connecting to wireless sender...")
@@ -328,6 +416,25 @@ class WebPReceiver:
             print(f"❌ Wireless connection failed: {e}")
             return False
     
+    def _init_wireless_udp(self):
+        """Initialize UDP wireless endpoint"""
+        try:
+            self.wireless_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TCP_BUFFER_SIZE)
+            
+            # connect()只设置默认对端，之后可以直接send/recv
+            self.wireless_socket.connect((WIRELESS_HOST, WIRELESS_PORT))
+            self.wireless_socket.send(UDP_HELLO)
+            self.wireless_socket.settimeout(RECEIVE_TIMEOUT)
+            
+            print(f"🌐 Wireless UDP endpoint ready")
+            print(f"   Sender: {WIRELESS_HOST}:{WIRELESS_PORT}")
+            print(f"   Speed: {self.baud_rate/1000}K bps")
+            return True
+        except Exception as e:
+            print(f"❌ Wireless connection failed: {e}")
+            return False
+    
     def decode_frame_webp(self, webp_data):
         """WebP frame decoding"""
         try:
@@ -382,17 +489,8 @@ class WebPReceiver:
     
     def calculate_frame_hash(self, frame_data):
         """Calculate frame data hash for verification"""
-        if USE_SIMPLIFIED_PROTOCOL:
-            # 使用简单的校验和代替MD5哈希，减少计算开销
-            checksum = 0
-            # 每1024字节采样一次以加快计算速度
-            for i in range(0, len(frame_data), 1024):
-                chunk = frame_data[i:i+1024]
-                checksum = (checksum + sum(chunk)) & 0xFFFFFFFF
-            return struct.pack('<I', checksum)
-        else:
-            # 原始MD5哈希方法
-            return hashlib.md5(frame_data).digest()[:4]
+        # CRC32校验 (zlib使用硬件加速CRC指令)，比MD5快得多且只需要4字节
+        return CRC32.pack(zlib.crc32(frame_data))
     
     def receive_packet(self):
         """Receive data packet"""
@@ -400,6 +498,8 @@ class WebPReceiver:
             # Select receiving method according to transmission mode
             if self.transmission_mode == 'uart':
                 return self.receive_packet_uart()
+            elif self.wireless_transport == 'udp':
+                return self.receive_packet_udp()
             else:
                 return self.receive_packet_wireless()
         except Exception as e:
@@ -450,7 +550,7 @@ class WebPReceiver:
             if USE_SIMPLIFIED_PROTOCOL:
                 # 简化协议: Magic(2) + Length(2) + Hash(4) + Data
                 # 确保我们有足够的数据来读取头部
-                header_size = len(PROTOCOL_MAGIC) + 2 + 4  # Magic + Length + Hash
+                header_size = SIMPLE_HEADER.size  # Magic + Length + Hash
                 
                 # 读取完整的头部
                 while len(buffer) < header_size:
@@ -460,8 +560,7 @@ class WebPReceiver:
                     buffer.extend(chunk)
                 
                 # 解析简化的头部
-                packet_length = struct.unpack('<H', buffer[len(PROTOCOL_MAGIC):len(PROTOCOL_MAGIC)+2])[0]
-                expected_hash = buffer[len(PROTOCOL_MAGIC)+2:len(PROTOCOL_MAGIC)+2+4]
+                _, packet_length, expected_hash = SIMPLE_HEADER.unpack_from(buffer)
                 
                 # 验证包长度
                 if packet_length > 10000 or packet_length < 50:
@@ -492,20 +591,18 @@ class WebPReceiver:
                 
             else:
                 # 原始协议处理
-                # Ensure complete header (4+4+4+8+4=24)
-                while len(buffer) < 24:
+                # Ensure complete header
+                while len(buffer) < FULL_HEADER.size:
                     # Read the remaining header bytes at once
-                    remaining_header = 24 - len(buffer)
+                    remaining_header = FULL_HEADER.size - len(buffer)
                     chunk = self.ser_receiver.read(remaining_header)
                     if not chunk:
                         return None, None
                     buffer.extend(chunk)
                 
                 # Parse header
-                frame_id = struct.unpack('<I', buffer[4:8])[0]
-                packet_length = struct.unpack('<I', buffer[8:12])[0]
-                packet_type = buffer[12:20].decode('ascii').strip()
-                expected_hash = buffer[20:24]
+                _, frame_id, packet_length, type_bytes, expected_hash = FULL_HEADER.unpack_from(buffer)
+                packet_type = type_bytes.decode('ascii').strip()
                 
                 # Verify packet length
                 if packet_length > 10000 or packet_length < 50:
@@ -513,7 +610,7 @@ class WebPReceiver:
                     return None, None
                 
                 # Read remaining data - optimize by reading larger chunks
-                remaining = packet_length - (len(buffer) - 24)
+                remaining = packet_length - (len(buffer) - FULL_HEADER.size)
                 
                 # Try to read all remaining data at once if possible
                 if remaining > 0:
@@ -524,7 +621,7 @@ class WebPReceiver:
                     buffer.extend(data_chunk)
                 
                 # Extract packet data
-                packet_data = bytes(buffer[24:24+packet_length])
+                packet_data = bytes(buffer[FULL_HEADER.size:FULL_HEADER.size+packet_length])
                 
                 # Verify hash
                 actual_hash = self.calculate_frame_hash(packet_data)
@@ -545,6 +642,79 @@ class WebPReceiver:
             self.stats['errors'] += 1
             return None, None
     
+    def receive_packet_udp(self):
+        """UDP method to receive data packet (one packet per datagram)"""
+        try:
+            datagram = self.wireless_socket.recv(65536)
+        except (socket.timeout, BlockingIOError):
+            # 长时间没有数据报时视为发送端已停止，下一个流重新开始计序号
+            if (self.udp_expected_seq is not None and
+                    time.monotonic() - self.udp_last_datagram_time > UDP_STREAM_TIMEOUT):
+                print("⚠️  UDP stream silent, waiting for sender to restart...")
+                self.udp_expected_seq = None
+            # 还没有数据流时重发注册包 (发送端可能晚于接收端启动或已重启)
+            if self.udp_expected_seq is None:
+                try:
+                    self.wireless_socket.send(UDP_HELLO)
+                except OSError:
+                    pass
+            return None, None
+        except OSError:
+            # 发送端尚未启动时会收到ICMP端口不可达
+            return None, None
+        
+        if len(datagram) < 4:
+            return None, None
+        
+        # 序列号检测丢包，迟到的乱序旧包直接丢弃
+        # 大幅回退说明发送端已重启 (序列号从0开始)，按新的流重新计序号
+        seq = UDP_SEQ.unpack_from(datagram)[0]
+        self.udp_last_datagram_time = time.monotonic()
+        if self.udp_expected_seq is not None:
+            gap = (seq - self.udp_expected_seq) & 0xFFFFFFFF
+            if gap < 0x80000000:
+                self.stats['frames_lost'] += gap
+            elif (self.udp_expected_seq - seq) & 0xFFFFFFFF <= UDP_REORDER_WINDOW:
+                return None, None
+            else:
+                print("🔄 UDP sequence restarted, sender reconnected")
+        self.udp_expected_seq = (seq + 1) & 0xFFFFFFFF
+        
+        packet = datagram[4:]
+        if not packet.startswith(PROTOCOL_MAGIC):
+            self.stats['errors'] += 1
+            return None, None
+        
+        if USE_SIMPLIFIED_PROTOCOL:
+            # 简化协议: Magic(2) + Length(2) + Hash(4) + Data
+            header_size = SIMPLE_HEADER.size
+            _, packet_length, expected_hash = SIMPLE_HEADER.unpack_from(packet)
+            packet_type = PACKET_TYPE
+        else:
+            # 原始协议头部
+            header_size = FULL_HEADER.size
+            _, _, packet_length, type_bytes, expected_hash = FULL_HEADER.unpack_from(packet)
+            packet_type = type_bytes.decode('ascii').strip()
+        
+        packet_data = packet[header_size:]
+        if len(packet_data) != packet_length:
+            print(f"⚠️  Truncated datagram: {len(packet_data)}/{packet_length} bytes")
+            self.stats['errors'] += 1
+            return None, None
+        
+        if self.calculate_frame_hash(packet_data) != expected_hash:
+            print("⚠️  Packet hash verification failed")
+            self.stats['errors'] += 1
+            return None, None
+        
+        self.stats['frames_received'] += 1
+        self.stats['bytes_received'] += len(packet_data)
+        self.stats['packet_sizes'].append(len(packet_data))
+        self.last_successful_time = time.time()
+        self.error_count = 0
+        
+        return packet_data, packet_type
+    
     def receive_packet_wireless(self):
         """Wireless method to receive data packet"""
         try:
@@ -582,7 +752,7 @@ class WebPReceiver:
             if USE_SIMPLIFIED_PROTOCOL:
                 # 简化协议: Magic(2) + Length(2) + Hash(4) + Data
                 # 确保我们有足够的数据来读取头部
-                header_size = len(PROTOCOL_MAGIC) + 2 + 4  # Magic + Length + Hash
+                header_size = SIMPLE_HEADER.size  # Magic + Length + Hash
                 
                 # 读取完整的头部
                 while len(buffer) < header_size:
@@ -595,8 +765,7 @@ class WebPReceiver:
                         return None, None
                 
                 # 解析简化的头部
-                packet_length = struct.unpack('<H', buffer[len(PROTOCOL_MAGIC):len(PROTOCOL_MAGIC)+2])[0]
-                expected_hash = buffer[len(PROTOCOL_MAGIC)+2:len(PROTOCOL_MAGIC)+2+4]
+                _, packet_length, expected_hash = SIMPLE_HEADER.unpack_from(buffer)
                 
                 # 验证包长度
                 if packet_length > 10000 or packet_length < 50:
@@ -632,8 +801,8 @@ class WebPReceiver:
                 
             else:
                 # 原始协议处理
-                # Ensure complete header (4+4+4+8+4=24)
-                while len(buffer) < 24:
+                # Ensure complete header
+                while len(buffer) < FULL_HEADER.size:
                     try:
                         byte = self.wireless_socket.recv(1)
                         if not byte:
@@ -643,10 +812,8 @@ class WebPReceiver:
                         return None, None
                 
                 # Parse header
-                frame_id = struct.unpack('<I', buffer[4:8])[0]
-                packet_length = struct.unpack('<I', buffer[8:12])[0]
-                packet_type = buffer[12:20].decode('ascii').strip()
-                expected_hash = buffer[20:24]
+                _, frame_id, packet_length, type_bytes, expected_hash = FULL_HEADER.unpack_from(buffer)
+                packet_type = type_bytes.decode('ascii').strip()
                 
                 # Verify packet length
                 if packet_length > 10000 or packet_length < 50:
@@ -654,7 +821,7 @@ class WebPReceiver:
                     return None, None
                 
                 # Read remaining data
-                remaining = packet_length - (len(buffer) - 24)
+                remaining = packet_length - (len(buffer) - FULL_HEADER.size)
                 while remaining > 0:
                     try:
                         chunk = self.wireless_socket.recv(min(remaining, 1024))
@@ -668,7 +835,7 @@ class WebPReceiver:
                         return None, None
                 
                 # Extract packet data
-                packet_data = bytes(buffer[24:24+packet_length])
+                packet_data = bytes(buffer[FULL_HEADER.size:FULL_HEADER.size+packet_length])
                 
                 # Verify hash
                 actual_hash = self.calculate_frame_hash(packet_data)
@@ -694,32 +861,25 @@ class WebPReceiver:
         try:
             # 高速模式 (>=2MHz) 使用特殊优化
             if self.is_high_speed:
+                # 尝试非阻塞接收
                 try:
-                    # 尝试非阻塞接收
-                    try:
-                        chunk = self.wireless_socket.recv(65536)  # 尝试一次性接收大量数据
-                    except socket.error as e:
-                        if str(e).find('10035') >= 0:  # WSAEWOULDBLOCK
-                            # 没有数据可用，不是错误
-                            return None, None
-                        else:
-                            # 其他错误
-                            raise e
-                    
-                    if not chunk:
-                        return None, None
-                    
-                    # 添加到缓冲区
-                    self.recv_buffer[self.recv_buffer_pos:self.recv_buffer_pos+len(chunk)] = chunk
-                    self.recv_buffer_pos += len(chunk)
-                    
-                    # 查找完整的包
-                    return self._find_packet_in_buffer()
-                    
-                except Exception as e:
-                    if not str(e).find('10035') >= 0:  # 不是WSAEWOULDBLOCK
-                        print(f"⚠️ High speed receive error: {e}")
+                    chunk = self.wireless_socket.recv(65536)  # 尝试一次性接收大量数据
+                except (BlockingIOError, socket.timeout):
+                    # 没有数据可用 (EWOULDBLOCK / WSAEWOULDBLOCK)，不是错误
+                    return None, None
+                except OSError as e:
+                    print(f"⚠️ High speed receive error: {e}")
+                    return None, None
+                
+                if not chunk:
                     return None, None
+                
+                # 添加到缓冲区
+                self.recv_buffer[self.recv_buffer_pos:self.recv_buffer_pos+len(chunk)] = chunk
+                self.recv_buffer_pos += len(chunk)
+                
+                # 查找完整的包
+                return self._find_packet_in_buffer()
             
             # 1MHz模式优化
             try:
@@ -779,7 +939,7 @@ class WebPReceiver:
         # 找到魔术字节，开始解析
         if USE_SIMPLIFIED_PROTOCOL:
             # 简化协议: Magic(2) + Length(2) + Hash(4) + Data
-            header_size = len(PROTOCOL_MAGIC) + 2 + 4  # Magic + Length + Hash
+            header_size = SIMPLE_HEADER.size  # Magic + Length + Hash
             
             # 确保有足够的数据解析头部
             if magic_pos + header_size > self.recv_buffer_pos:
@@ -789,9 +949,8 @@ class WebPReceiver:
                 self.recv_buffer_pos = len(incomplete_data)
                 return None, None
             
-            # 解析包长度
-            length_bytes = buffer_bytes[magic_pos+len(PROTOCOL_MAGIC):magic_pos+len(PROTOCOL_MAGIC)+2]
-            packet_length = struct.unpack('<H', length_bytes)[0]
+            # 解析包长度和哈希值
+            _, packet_length, expected_hash = SIMPLE_HEADER.unpack_from(buffer_bytes, magic_pos)
             
             # 验证包长度
             if packet_length > 10000 or packet_length < 50:
@@ -813,8 +972,7 @@ class WebPReceiver:
                 # 包不完整，继续等待数据
                 return None, None
             
-            # 提取哈希值和数据
-            expected_hash = buffer_bytes[magic_pos+len(PROTOCOL_MAGIC)+2:magic_pos+len(PROTOCOL_MAGIC)+2+4]
+            # 提取数据
             packet_data = buffer_bytes[magic_pos+header_size:magic_pos+header_size+packet_length]
             
             # 验证哈希
@@ -904,7 +1062,7 @@ class WebPReceiver:
             if USE_SIMPLIFIED_PROTOCOL:
                 # 简化协议: Magic(2) + 'HS'(2) + Counter(2)
                 # 确保我们有足够的数据来读取握手包
-                handshake_size = len(PROTOCOL_MAGIC) + 2 + 2  # Magic + HS + Counter
+                handshake_size = HANDSHAKE_HEADER.size  # Magic + HS + Counter
                 
                 # 读取完整的握手包
                 while len(buffer) < handshake_size:
@@ -913,15 +1071,11 @@ class WebPReceiver:
                         return False
                     buffer.extend(chunk)
                 
-                # 验证是否是握手包
-                hs_marker = buffer[len(PROTOCOL_MAGIC):len(PROTOCOL_MAGIC)+2]
+                # 验证是否是握手包并提取计数器
+                _, hs_marker, handshake_id = HANDSHAKE_HEADER.unpack_from(buffer)
                 if hs_marker != b'HS':
                     return False
                 
-                # 提取计数器
-                counter_bytes = buffer[len(PROTOCOL_MAGIC)+2:len(PROTOCOL_MAGIC)+2+2]
-                handshake_id = struct.unpack('<H', counter_bytes)[0]
-                
                 # 更新握手状态
                 self.last_handshake_time = time.time()
                 self.handshake_active = True
@@ -935,20 +1089,18 @@ class WebPReceiver:
                 
             else:
                 # 原始握手包处理
-                # Ensure complete header (4+4+4+8+4=24)
-                while len(buffer) < 24:
+                # Ensure complete header
+                while len(buffer) < FULL_HEADER.size:
                     # Read the remaining header bytes at once
-                    remaining_header = 24 - len(buffer)
+                    remaining_header = FULL_HEADER.size - len(buffer)
                     chunk = self.ser_receiver.read(remaining_header)
                     if not chunk:
                         return False
                     buffer.extend(chunk)
                 
                 # Parse header
-                handshake_id = struct.unpack('<I', buffer[4:8])[0]
-                packet_length = struct.unpack('<I', buffer[8:12])[0]
-                packet_type = buffer[12:20].decode('ascii').strip()
-                expected_hash = buffer[20:24]
+                _, handshake_id, packet_length, type_bytes, expected_hash = FULL_HEADER.unpack_from(buffer)
+                packet_type = type_bytes.decode('ascii').strip()
                 
                 # Verify it's a handshake packet
                 if packet_type != "HNDSHK":
@@ -960,7 +1112,7 @@ class WebPReceiver:
                     return False
                 
                 # Read remaining data - optimize by reading all at once
-                remaining = packet_length - (len(buffer) - 24)
+                remaining = packet_length - (len(buffer) - FULL_HEADER.size)
                 if remaining > 0:
                     data_chunk = self.ser_receiver.read(remaining)
                     if len(data_chunk) != remaining:
@@ -968,7 +1120,7 @@ class WebPReceiver:
                     buffer.extend(data_chunk)
                 
                 # Extract packet data
-                packet_data = bytes(buffer[24:24+packet_length])
+                packet_data = bytes(buffer[FULL_HEADER.size:FULL_HEADER.size+packet_length])
                 
                 # Verify hash
                 actual_hash = self.calculate_frame_hash(packet_data)
@@ -1336,6 +1488,7 @@ class WebPReceiver:
                     if current_time - last_fps_time >= 1.0:
                         fps = frame_count_for_fps / (current_time - last_fps_time)
                         self.stats['fps_history'].append(fps)
+                        self.stats['fps_recent'].append(fps)
                         last_fps_time = current_time
                         frame_count_for_fps = 0
                     
@@ -1355,9 +1508,9 @@ class WebPReceiver:
         font_scale = 0.4
         thickness = 1
         
-        avg_compression = np.mean(list(self.stats['compression_ratios'])) if self.stats['compression_ratios'] else 1.0
-        avg_packet_size = np.mean(list(self.stats['packet_sizes'])) if self.stats['packet_sizes'] else 0
-        current_fps = np.mean(list(self.stats['fps_history'])[-3:]) if len(self.stats['fps_history']) >= 3 else 0
+        avg_compression = self.stats['compression_ratios'].mean if self.stats['compression_ratios'] else 1.0
+        avg_packet_size = self.stats['packet_sizes'].mean
+        current_fps = self.stats['fps_recent'].mean if len(self.stats['fps_recent']) >= 3 else 0
         
         # 高性能模式下的优化状态显示
         if self.is_high_performance:
@@ -1468,18 +1621,22 @@ class WebPReceiver:
         
         print("🚀 WebP receiver started successfully")
         print("🔄 Transmission mode: " + self.transmission_mode.upper())
+        if self.transmission_mode != 'uart':
+            print("📡 Wireless transport: " + self.wireless_transport.upper())
         
         return True
     
     def print_stats(self):
         """Print statistics"""
-        avg_compression = np.mean(list(self.stats['compression_ratios'])) if self.stats['compression_ratios'] else 1.0
-        avg_packet_size = np.mean(list(self.stats['packet_sizes'])) if self.stats['packet_sizes'] else 0
-        current_fps = np.mean(list(self.stats['fps_history'])[-5:]) if len(self.stats['fps_history']) >= 5 else 0
+        avg_compression = self.stats['compression_ratios'].mean if self.stats['compression_ratios'] else 1.0
+        avg_packet_size = self.stats['packet_sizes'].mean
+        current_fps = self.stats['fps_history'].mean if len(self.stats['fps_history']) >= 5 else 0
+        
+        lost_info = f" Lost:{self.stats['frames_lost']}" if self.wireless_transport == 'udp' else ""
         
         print(f"📊 Receive statistics - Compression:{avg_compression:.1f}x FPS:{current_fps:.1f}fps "
               f"Packet size:{avg_packet_size:.0f}B Received:{self.stats['frames_received']} "
-              f"Displayed:{self.stats['frames_displayed']} Errors:{self.stats['errors']}")
+              f"Displayed:{self.stats['frames_displayed']} Errors:{self.stats['errors']}{lost_info}")
     
     def stop(self):
         """Stop reception"""
@@ -1520,9 +1677,13 @@ def main():
     
     # Select transmission mode
     transmission_mode, baud_rate = select_transmission_mode()
+    wireless_transport = None
+    if transmission_mode != 'uart':
+        wireless_transport = select_wireless_transport()
     
     # Create WebP receiver
-    receiver = WebPReceiver(transmission_mode=transmission_mode, baud_rate=baud_rate)
+    receiver = WebPReceiver(transmission_mode=transmission_mode, baud_rate=baud_rate,
+                            wireless_transport=wireless_transport)
     
     # Start reception
     if not receiver.start():
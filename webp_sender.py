@@ -13,11 +13,14 @@ import time
 import struct
 import threading
 from collections import deque
-import hashlib
-import io
-from PIL import Image
+import zlib
 import socket
-import select
+import selectors
+import multiprocessing
+from multiprocessing import shared_memory
+import io
+import sys
+from PIL import Image  # 需要指定WebP method (非默认的4) 时编码
 
 # ==================== Transmission Mode Selection ====================
 def select_transmission_mode():
@@ -74,6 +77,21 @@ def select_wireless_speed():
         else:
             print("❌ Invalid choice, please enter 1-4")
 
+def select_wireless_transport():
+    """Select wireless transport protocol"""
+    print("\n📡 Please select wireless transport:")
+    print("1. TCP - Reliable stream (default)")
+    print("2. UDP - Lowest latency, lost packets are dropped frames")
+    
+    while True:
+        choice = input("Please enter choice (1 or 2, Enter for TCP): ").strip()
+        if choice in ('', '1'):
+            return 'tcp'
+        elif choice == '2':
+            return 'udp'
+        else:
+            print("❌ Invalid choice, please enter 1 or 2")
+
 # Default configuration (will be selected in main function)
 TRANSMISSION_MODE = 'uart'
 BAUD_RATE = 300000
@@ -81,17 +99,19 @@ BAUD_RATE = 300000
 # ==================== Configuration Parameters ====================
 # Serial port configuration (UART mode)
 SENDER_PORT = 'COM7'        # Sender port (modify according to actual situation)
+UART_BUFFER_SIZE = 65536    # 驱动侧串口收发缓冲区大小 (仅Windows驱动支持设置)
 
 # Wireless configuration (wireless mode)
 WIRELESS_HOST = '127.0.0.1'  # Server IP (localhost for same computer testing)
 WIRELESS_PORT = 8888         # Wireless port
+WIRELESS_TRANSPORT = 'tcp'   # 无线传输层: 'tcp' 或 'udp' (UDP无队头阻塞，丢包即丢帧)
 
 # Connection role
 WIRELESS_ROLE = 'server'     # 发送端作为服务器端
 
 # TCP Socket optimizations
 TCP_NODELAY = True           # 禁用Nagle算法，减少延迟
-TCP_BUFFER_SIZE = 262144     # 设置更大的发送缓冲区 (256KB)
+TCP_BUFFER_SIZE = 1048576    # 设置更大的发送缓冲区 (1MB)
 SOCKET_TIMEOUT = 0.5         # Socket超时设置
 
 # Camera configuration
@@ -101,6 +121,10 @@ FRAME_HEIGHT = 240          # Frame height
 WIRELESS_FRAME_WIDTH = 640  # 无线模式帧宽度
 WIRELESS_FRAME_HEIGHT = 480 # 无线模式帧高度
 USE_COLOR_FOR_WIRELESS = True  # 无线模式使用彩色图像
+GRAYSCALE_PERFORMANCE_MODES = ("ultra_fast", "high_fps")  # 这些模式下无线也用灰度 (单通道编码约快2倍)
+USE_CAPTURE_PROCESS = False # 在独立进程中采集和预处理图像 (避开GIL，通过共享内存传递帧)
+CAMERA_MANUAL_EXPOSURE = True  # 关闭自动曝光 (暗光下自动曝光会拉长曝光时间，read()阻塞100-300ms)
+OPENCV_THREADS = 2          # OpenCV内部线程数 (小分辨率帧开太多线程反而更慢)
 
 # Performance mode configuration (options: high_fps, balanced, high_quality, ultra_fast)
 PERFORMANCE_MODE = "balanced"
@@ -108,19 +132,258 @@ PERFORMANCE_MODE = "balanced"
 # Advanced configuration (generally no need to modify)
 PROTOCOL_MAGIC = b'WP'      # 缩短魔术字节为2字节
 PACKET_TYPE = "WEBP"        # Packet type
+HANDSHAKE_TYPE = "HNDSHK"   # 握手包类型 (原始协议)
+UDP_HELLO = b'WPHI'         # UDP模式下接收端发送的注册包
+FRAME_HISTORY_SIZE = 100    # 帧统计环形缓冲区大小
+MK_FIRM_WINDOW = 10         # (m,k)-firm丢帧：统计最近k帧的发送结果
+MK_FIRM_MIN_SUCCESS = 7     # 最近k帧成功少于m帧且持续出错时，只编码探测帧，其余帧不编码直接丢弃
+PIPELINE_QUEUE_SIZE = 2     # 采集→编码→发送流水线各级之间的队列深度 (满时丢弃最旧的帧)
+SKIP_DUPLICATE_FRAMES = True   # 画面几乎没有变化时重发上一帧的编码数据，跳过WebP编码
+DUPLICATE_FRAME_THRESHOLD = 6  # 1/8缩略图(区域平均)的最大像素差不超过该值视为重复帧
+ADAPTIVE_WEBP_METHOD = True # 根据实测编码耗时自动调整WebP method
+CV2_WEBP_METHOD = 4         # cv2.imencode固定使用libwebp默认的method 4，其他method通过Pillow编码
+QUALITY_STATUS_LOG = True   # 每次质量调整后打印发送状态 (关闭可减少发送线程的格式化开销)
+HANDSHAKE_STATUS_LOG = True # 每20次握手打印一次握手状态 (关闭可减少握手线程的格式化和stdout写入)
+QUALITY_STABILITY_CV = 0.3  # 最近包大小的变异系数超过此值时不提高质量 (画面剧烈变化，避免质量来回振荡)
+QUALITY_PI_KP = 4.0         # 质量PI控制器比例增益 (负载偏差变化1.0时质量变化的级数)
+QUALITY_PI_KI = 3.0         # 质量PI控制器积分增益 (每次调整按当前负载偏差累积的级数)
+QUALITY_ENCODE_BUDGET = 0.8 # 编码耗时预算占帧周期的比例
+WARNING_INTERVAL = 1.0      # 热路径上同类警告的最小打印间隔 (秒)
 
 # 优化协议设置
 USE_SIMPLIFIED_PROTOCOL = True  # 使用简化协议以减少开销
 # ================================================
 
+# 协议头格式 (预编译，打包到复用的头部缓冲区)
+SIMPLE_HEADER = struct.Struct(f'<{len(PROTOCOL_MAGIC)}sH4s')    # Magic + Length + Hash
+FULL_HEADER = struct.Struct(f'<{len(PROTOCOL_MAGIC)}sII8s4s')   # Magic + FrameID + Length + Type + Hash
+HANDSHAKE_HEADER = struct.Struct(f'<{len(PROTOCOL_MAGIC)}s2sH') # Magic + 'HS' + Counter
+UDP_SEQ = struct.Struct('<I')                                   # UDP数据报序列号
+CRC32 = struct.Struct('<I')                                     # 帧数据CRC32校验值
+
+# 启用OpenCV的SIMD优化路径；resize/cvtColor处理的帧很小，
+# 且采集/编码/发送已分别占用线程，限制OpenCV线程池避免过度订阅
+cv2.setUseOptimized(True)
+cv2.setNumThreads(OPENCV_THREADS)
+
+class RollingMean:
+    """Fixed-size sample window with an O(1) running mean"""
+    
+    def __init__(self, maxlen):
+        self._values = deque(maxlen=maxlen)
+        self._sum = 0.0
+    
+    def append(self, value):
+        # 窗口已满时先减去即将被挤出的最旧值
+        if len(self._values) == self._values.maxlen:
+            self._sum -= self._values[0]
+        self._values.append(value)
+        self._sum += value
+    
+    @property
+    def mean(self):
+        return self._sum / len(self._values) if self._values else 0.0
+    
+    def clear(self):
+        self._values.clear()
+        self._sum = 0.0
+    
+    def __len__(self):
+        return len(self._values)
+
+class FrameQueue:
+    """Bounded queue between pipeline stages that drops the oldest item when full"""
+    
+    def __init__(self, maxlen, on_drop=None):
+        self._items = deque()
+        self._maxlen = maxlen
+        self._on_drop = on_drop  # 被丢弃的元素交给回调 (例如回收帧缓冲区)
+        self._cond = threading.Condition()
+    
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self._maxlen:
+                dropped = self._items.popleft()
+            self._items.append(item)
+            self._cond.notify()
+        if dropped is not None and self._on_drop:
+            self._on_drop(dropped)
+    
+    def get(self, timeout=None, latest=False):
+        """Pop the oldest item, or the newest one (dropping the rest); None on timeout"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            if not latest:
+                return self._items.popleft()
+            item = self._items.pop()
+            dropped = list(self._items)
+            self._items.clear()
+        if self._on_drop:
+            for old in dropped:
+                self._on_drop(old)
+        return item
+
+def open_camera(width, height, use_color):
+    """Open the camera and configure it for the target resolution
+    
+    Returns (cap, read_frame), or (None, None) if the camera cannot be opened.
+    """
+    # 显式选择采集后端：Windows默认的MSMF打开慢且不一定接受MJPG，Linux直接使用V4L2
+    if sys.platform.startswith('win'):
+        backend = cv2.CAP_DSHOW
+    elif sys.platform.startswith('linux'):
+        backend = cv2.CAP_V4L2
+    else:
+        backend = cv2.CAP_ANY
+    
+    cap = cv2.VideoCapture(CAMERA_INDEX, backend)
+    if not cap.isOpened() and backend != cv2.CAP_ANY:
+        # 指定后端不可用时退回OpenCV的默认选择
+        cap = cv2.VideoCapture(CAMERA_INDEX)
+    if not cap.isOpened():
+        return None, None
+    
+    # 请求MJPG格式 (必须在设置分辨率之前)，让摄像头直接输出目标分辨率
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    # 驱动只缓存1帧，read()总是拿到最新画面而不是排队的旧帧
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    
+    if CAMERA_MANUAL_EXPOSURE:
+        # 手动曝光的取值因后端而异：DSHOW为0.25，V4L2为1 (V4L2_EXPOSURE_MANUAL)
+        manual = 1 if cap.getBackendName() == 'V4L2' else 0.25
+        if cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, manual):
+            print("- Auto exposure disabled")
+    
+    # 灰度模式下尝试让摄像头直接输出灰度图像，跳过cvtColor
+    if not use_color:
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        ret, frame = cap.read()
+        
+        # 只有确实得到目标尺寸的单通道图像时才保留设置
+        # (部分驱动会返回未解码的MJPG/YUYV原始数据)
+        if ret and frame.ndim == 2 and frame.shape == (height, width):
+            print("- Native grayscale capture enabled (cvtColor skipped)")
+            return cap, cap.read
+        
+        # 退而求其次：YUYV格式的Y平面就是灰度图，省去MJPG解码和BGR转换
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        ret, frame = cap.read()
+        if ret and frame.ndim == 3 and frame.shape == (height, width, 2):
+            print("- YUYV capture enabled (grayscale taken from the Y plane)")
+            return cap, lambda: read_yuyv_luma(cap)
+        
+        # 都不支持时恢复MJPG + BGR输出，由采集线程转换灰度
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+    
+    return cap, cap.read
+
+def read_yuyv_luma(cap):
+    """Read a raw YUYV frame and return its Y plane as a grayscale image"""
+    ret, frame = cap.read()
+    if ret:
+        frame = cv2.cvtColor(frame, cv2.COLOR_YUV2GRAY_YUYV)
+    return ret, frame
+
+_warning_state = {}
+
+def print_throttled(key, message):
+    """Print a hot-path warning at most once per WARNING_INTERVAL for each key"""
+    # 链路异常时发送/编码循环每帧都会报错，逐条打印会拖慢循环并刷屏
+    now = time.monotonic()
+    last_time, suppressed = _warning_state.get(key, (float('-inf'), 0))
+    if now - last_time < WARNING_INTERVAL:
+        _warning_state[key] = (last_time, suppressed + 1)
+        return
+    if suppressed:
+        message += f" ({suppressed} similar suppressed)"
+    print(message)
+    _warning_state[key] = (now, 0)
+
+def resize_interpolation(frame, width, height):
+    """Pick the interpolation for scaling a frame to (width, height)"""
+    src_height, src_width = frame.shape[:2]
+    # 整数倍缩小时INTER_AREA有SIMD快速路径且抗混叠(编码后更小)；
+    # 非整数倍时它比INTER_LINEAR慢约5倍，放大时也没有优势
+    if src_width % width == 0 and src_height % height == 0:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+def set_timer_resolution(enable):
+    """Request 1ms timer resolution on Windows while transmitting"""
+    # Windows默认计时器精度约15.6ms，time.sleep(0.002)实际会睡一整个时钟周期
+    if not sys.platform.startswith('win'):
+        return False
+    try:
+        import ctypes
+        winmm = ctypes.windll.winmm
+        if enable:
+            return winmm.timeBeginPeriod(1) == 0
+        winmm.timeEndPeriod(1)
+    except (ImportError, AttributeError, OSError):
+        pass
+    return False
+
+def capture_process_main(shm_name, shape, use_color, frame_ready, frame_seq, ready, stop_event):
+    """Capture process: grab and preprocess frames into shared memory"""
+    height, width = shape[:2]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    shared_frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    
+    cap, read_frame = open_camera(width, height, use_color)
+    if cap is None:
+        shm.close()
+        ready.set()  # 以frame_seq仍为-1通知主进程打开失败
+        return
+    
+    frame_seq.value = 0
+    ready.set()
+    
+    try:
+        while not stop_event.is_set():
+            ret, frame = read_frame()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            
+            # 源图比目标小时先转灰度再放大 (与采集线程相同的顺序选择)
+            if not use_color and frame.ndim == 3 and frame.shape[0] * frame.shape[1] < height * width:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height),
+                                   interpolation=resize_interpolation(frame, width, height))
+            if not use_color and frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            
+            # 只保留最新一帧，发送端总是拿到最新画面；写入后唤醒等待新帧的采集线程
+            with frame_ready:
+                shared_frame[...] = frame
+                frame_seq.value += 1
+                frame_ready.notify_all()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+        del shared_frame
+        shm.close()
+
 class WirelessUARTController:
     """Wireless UART Controller - Intelligent UART transmission rate control"""
     
     def __init__(self, baud_rate):
         self.baud_rate = baud_rate
         self.bytes_per_second = baud_rate / 8  # Bytes per second
-        self.last_send_time = time.time()
-        self.bytes_sent_this_second = 0
         
         # 1MHz模式特殊优化
         self.is_1mhz_mode = (baud_rate == 1000000)
@@ -144,88 +407,48 @@ class WirelessUARTController:
             self.burst_allowance = 1.0   # Strict limit
             self.adaptive_window = 1.0   # 1 second window
         
+        # 令牌桶：按 bytes_per_second * burst_allowance 持续补充，
+        # 桶容量为一个窗口的额度 (允许的最大突发)
+        # 不再按窗口整体重置计数器，避免窗口边界处的突发和漂移
+        self.fill_rate = self.bytes_per_second * self.burst_allowance
+        self.capacity = self.fill_rate * self.adaptive_window
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+    
+    def _available_tokens(self, now):
+        return min(self.capacity, self.tokens + (now - self.last_refill) * self.fill_rate)
+    
+    def is_congested(self, data_size):
+        """Check whether data_size bytes would have to wait (does not consume tokens)"""
+        if self.baud_rate >= 2000000:
+            return False
+        return data_size > self._available_tokens(time.monotonic())
+    
     def calculate_delay(self, data_size):
         """Calculate transmission delay to control UART rate"""
-        # 高速模式 (>=1MHz) - 几乎不限制传输速率
-        if self.is_high_speed and self.baud_rate >= 2000000:
-            # 对于2MHz以上的速率，基本不限制传输速率
+        # 高速模式 (>=2MHz) - 不限制传输速率
+        if self.baud_rate >= 2000000:
             return 0
-            
-        current_time = time.time()
         
-        # 1MHz模式专用算法
-        if self.is_1mhz_mode:
-            # 1MHz优化: 更短的时间窗口，更宽松的突发限制
-            time_window = self.adaptive_window
-            burst_multiplier = self.burst_allowance
-            
-            # Reset counter if time window exceeded
-            if current_time - self.last_send_time >= time_window:
-                self.last_send_time = current_time
-                self.bytes_sent_this_second = 0
-            
-            # Calculate allowed bytes in window - 利用更高比例的理论带宽
-            allowed_bytes = (self.bytes_per_second * time_window * burst_multiplier)
-            remaining_bytes = allowed_bytes - self.bytes_sent_this_second
-            
-            if data_size <= remaining_bytes:
-                # Can send immediately
-                self.bytes_sent_this_second += data_size
-                return 0
-            else:
-                # 计算最小等待时间
-                excess_bytes = data_size - remaining_bytes
-                min_wait = excess_bytes / (self.bytes_per_second * 2.5)  # 只等待最小时间
-                return min(min_wait, 0.002)  # 最多等待2ms
-        
-        # 原有逻辑（非1MHz模式）
-        # Ultra-high speed mode: Significantly reduce restrictions
-        if self.baud_rate >= 1000000:
-            # 1MHz and above: Very relaxed limits, focus on maintaining average rate rather than strict limiting
-            time_window = 0.1  # 100ms window
-            burst_multiplier = 3.0  # Allow 3x burst
-        elif self.baud_rate > 500000:
-            time_window = self.adaptive_window
-            burst_multiplier = self.burst_allowance
-        else:
-            time_window = 1.0
-            burst_multiplier = 1.0
-        
-        # Reset counter if time window exceeded
-        if current_time - self.last_send_time >= time_window:
-            self.last_send_time = current_time
-            self.bytes_sent_this_second = 0
-        
-        # Calculate allowed bytes in window
-        allowed_bytes = (self.bytes_per_second * time_window * burst_multiplier)
-        remaining_bytes = allowed_bytes - self.bytes_sent_this_second
+        now = time.monotonic()
+        self.tokens = self._available_tokens(now) - data_size
+        self.last_refill = now
         
-        if data_size <= remaining_bytes:
-            # Can send immediately
-            self.bytes_sent_this_second += data_size
+        # 令牌不足时本包仍然计入 (余额为负)，返回补足欠额所需的时间
+        # 调用方少等的部分会自动推迟到下一个包
+        if self.tokens >= 0:
             return 0
-        else:
-            # Ultra-high speed mode: Minimal wait time
-            if self.baud_rate >= 1000000:
-                # Calculate minimal delay to ensure high-speed transmission is not blocked
-                excess_bytes = data_size - remaining_bytes
-                min_wait = excess_bytes / (self.bytes_per_second * 2)  # Half wait time
-                return min(min_wait, 0.01)  # Wait at most 10ms
-            elif self.baud_rate > 500000:
-                excess_bytes = data_size - remaining_bytes
-                min_wait = excess_bytes / self.bytes_per_second
-                return min(min_wait, time_window - (current_time - self.last_send_time))
-            else:
-                # Standard wait time
-                wait_time = time_window - (current_time - self.last_send_time)
-                return max(0, wait_time)
+        return -self.tokens / self.fill_rate
 
 class WebPSender:
-    def __init__(self, performance_mode=PERFORMANCE_MODE, transmission_mode=None, baud_rate=None):
+    def __init__(self, performance_mode=PERFORMANCE_MODE, transmission_mode=None, baud_rate=None,
+                 wireless_transport=None):
         self.running = False
         self.frame_counter = 0
         self.successful_frames = 0
         self.failed_frames = 0
+        # 帧统计和质量调整由发送线程和编码线程 (超出链路预算的丢帧) 共同更新
+        self._stats_lock = threading.Lock()
         
         # Transmission related
         self.transmission_mode = transmission_mode or TRANSMISSION_MODE
@@ -237,32 +460,69 @@ class WebPSender:
         # Wireless (wireless mode)
         self.wireless_socket = None
         self.wireless_controller = None
+        self.wireless_transport = wireless_transport or WIRELESS_TRANSPORT
+        self.udp_peer = None  # UDP模式下接收端地址 (由注册包获知)
+        self.udp_seq = 0      # UDP数据报序列号
+        self._write_selector = None  # TCP发送缓冲区满时等待可写
+        self._has_sendmsg = hasattr(socket.socket, 'sendmsg')  # Windows没有sendmsg
+        
+        # 复用的协议头缓冲区，以及UART整包写入用的发送缓冲区 (长度字段最大65535)
+        self._header = bytearray(max(SIMPLE_HEADER.size, FULL_HEADER.size))
+        self._packet_buffer = bytearray(len(self._header) + 65535)
+        # 原始协议的8字节类型字段，预先编码，不必每包ljust/encode
+        self._type_fields = {t: t.ljust(8)[:8].encode('ascii') for t in (PACKET_TYPE, HANDSHAKE_TYPE)}
         if self.transmission_mode == 'wireless':
             self.wireless_controller = WirelessUARTController(self.baud_rate)
         
         # Hybrid mode
         self.handshake_thread = None
         self.handshake_running = False
+        self._handshake_stop = threading.Event()  # 停止时立即唤醒正在等待截止时间的握手线程
         self.handshake_counter = 0
         self.handshake_interval = 0.03  # 设置为30ms，提供更高的频率
         self.handshake_buffer = bytearray()  # 用于存储预生成的握手包
+        self._handshake_packets = []         # handshake_buffer中每个握手包的memoryview切片
         
         # Camera
         self.cap = None
+        self.capture_process = None  # 独立采集进程 (USE_CAPTURE_PROCESS)
         
-        # Smart buffering
-        self.frame_buffer = deque(maxlen=100)
+        # Smart buffering - 结构数组(SoA)环形缓冲区，记录最近帧的大小和发送结果
+        self._fb_size = np.zeros(FRAME_HISTORY_SIZE, dtype=np.int32)
+        self._fb_ok = np.zeros(FRAME_HISTORY_SIZE, dtype=np.uint8)
+        self._fb_count = 0  # 已记录的帧总数
+        
+        # 采集→编码→发送流水线
+        # 采集队列丢弃的旧帧回收到缓冲池，发送队列溢出的编码帧计入丢帧
+        self._frame_pool = deque()  # 可复用的帧缓冲区
+        self._capture_queue = FrameQueue(PIPELINE_QUEUE_SIZE, on_drop=self._recycle_frame)
+        self._send_queue = FrameQueue(PIPELINE_QUEUE_SIZE, on_drop=self._drop_encoded)
+        
+        # 重复帧检测 - 上一次实际编码的帧的缩略图和编码结果
+        self._prev_thumb = None
+        self._prev_encoded = None
+        self._prev_settings = None  # 缓存的编码数据所用的 (质量, method)
+        
+        # Pillow编码输出缓冲区 (仅编码线程使用，每帧复用)
+        self._webp_output = io.BytesIO()
+        
+        # 1MHz优化标志 (必须在setup_performance_mode之前初始化，否则会覆盖其设置)
+        self.optimized_for_1mhz = False
         
         # Performance mode configuration
         self.performance_mode = performance_mode
         self.setup_performance_mode()
         
-        # 1MHz优化标志
-        self.optimized_for_1mhz = False
+        # 传输模式和速率在运行期间不变，发送路径只需选择一次
+        self._transmit = self._select_transmit()
         
         # Error recovery
-        self.last_successful_time = time.time()
+        self.last_successful_time = time.monotonic()
         self.error_count = 0
+        
+        # 质量PI控制器状态 (增量式：上一次的负载偏差和未满一级的质量调整量)
+        self._quality_error = 0.0
+        self._quality_residual = 0.0
         self.recovery_mode = False
         
         # Statistics
@@ -271,10 +531,13 @@ class WebPSender:
             'bytes_sent': 0,
             'errors': 0,
             'recoveries': 0,
-            'compression_ratios': deque(maxlen=50),
-            'packet_sizes': deque(maxlen=50),
-            'fps_history': deque(maxlen=30),
-            'handshakes_sent': 0
+            'compression_ratios': RollingMean(50),
+            'packet_sizes': RollingMean(50),
+            'fps_history': RollingMean(5),  # 最近5秒的帧率
+            'encode_times': RollingMean(20),  # 最近20帧的编码耗时
+            'handshakes_sent': 0,
+            'frames_dropped': 0,  # 因链路拥塞丢弃的帧
+            'frames_repeated': 0  # 画面未变化、重发上一编码帧的次数
         }
         
     def setup_performance_mode(self):
@@ -283,14 +546,14 @@ class WebPSender:
             "high_fps": {
                 "quality": 30,
                 "target_packet_size": 975,
-                "webp_method": 4,  # Faster compression
+                "webp_method": 1,  # Faster compression
                 "fps_delay": 0.026,  # ~38fps
                 "description": "High FPS priority (38fps)"
             },
             "balanced": {
                 "quality": 50,
                 "target_packet_size": 1261,
-                "webp_method": 6,
+                "webp_method": 4,  # cv2.imencode快速路径
                 "fps_delay": 0.067,  # ~15fps
                 "description": "Balanced settings (15fps)"
             },
@@ -332,7 +595,7 @@ class WebPSender:
                 # 目标: 320×240 @ 24 fps, bpp≈0.30 (-q 45~50), 码率 ≈ 645 kbps
                 # 有效带宽利用率约为70-80%，所以1MHz理论上可以支持约800kbps的数据传输
                 self.current_quality = 45  # 设定为计算中的q值
-                self.webp_method = 3  # 降低压缩级别，加快编码速度
+                self.webp_method = 2  # 降低压缩级别，加快编码速度 (40fps需要每帧<25ms)
                 self.current_fps_delay = 0.025  # 约40fps
                 self.target_packet_size = int(self.target_packet_size * 1.2)  # 允许更大的包大小
                 
@@ -354,10 +617,10 @@ class WebPSender:
                 # 质量设置
                 if self.baud_rate >= 5000000:  # 5MHz
                     self.current_quality = 75  # 更高质量
-                    self.webp_method = 4      # 平衡压缩质量和速度
+                    self.webp_method = 1      # 带宽充足，优先编码速度
                 else:  # 2MHz
                     self.current_quality = 60
-                    self.webp_method = 3
+                    self.webp_method = 2      # 60fps需要每帧<16ms
                 
                 # 允许更大的包大小
                 self.target_packet_size = int(self.target_packet_size * (self.baud_rate / 1000000))
@@ -417,7 +680,8 @@ class WebPSender:
         
         # 根据传输模式决定是否使用彩色图像
         is_wireless_mode = self.transmission_mode in ['wireless', 'hybrid']
-        use_color = is_wireless_mode and USE_COLOR_FOR_WIRELESS
+        use_color = (is_wireless_mode and USE_COLOR_FOR_WIRELESS and
+                     self.performance_mode not in GRAYSCALE_PERFORMANCE_MODES)
         use_high_res = is_wireless_mode
         
         if use_color:
@@ -429,12 +693,6 @@ class WebPSender:
         print("- Smart dynamic quality adjustment")
         print(f"- Supports {self.transmission_mode.upper()} transmission mode")
         
-        # 初始化摄像头
-        self.cap = cv2.VideoCapture(CAMERA_INDEX)
-        if not self.cap.isOpened():
-            print("❌ Camera initialization failed")
-            return False
-        
         # 根据传输模式设置分辨率
         if use_high_res:
             width = WIRELESS_FRAME_WIDTH
@@ -444,15 +702,27 @@ class WebPSender:
             width = FRAME_WIDTH
             height = FRAME_HEIGHT
         
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
+        # 初始化摄像头
+        if USE_CAPTURE_PROCESS:
+            if not self._start_capture_process(width, height, use_color):
+                print("❌ Camera initialization failed")
+                return False
+            self._read_frame = self._read_shared_frame
+        else:
+            self.cap, self._read_frame = open_camera(width, height, use_color)
+            if self.cap is None:
+                print("❌ Camera initialization failed")
+                return False
         
         # 存储配置
         self.use_color = use_color
         self.frame_width = width
         self.frame_height = height
         
+        # 预分配灰度模式下resize的中间缓冲区 (仅采集线程使用)
+        # 送入流水线的帧使用缓冲池中的数组，见_acquire_frame
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        
         if use_color:
             print(f"✅ Camera initialization successful ({width}x{height} color)")
         else:
@@ -468,6 +738,58 @@ class WebPSender:
             wireless_success = self.init_wireless()
             return uart_success and wireless_success
     
+    def _start_capture_process(self, width, height, use_color):
+        """Start the capture process and map its shared frame buffer"""
+        shape = (height, width, 3) if use_color else (height, width)
+        nbytes = int(np.prod(shape))
+        
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._shared_frame = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._shared_ready = multiprocessing.Condition()  # 保护共享帧，并通知有新帧
+        self._shared_seq = multiprocessing.Value('q', -1, lock=False)
+        self._last_shared_seq = 0
+        self._capture_stop = multiprocessing.Event()
+        ready = multiprocessing.Event()
+        
+        self.capture_process = multiprocessing.Process(
+            target=capture_process_main,
+            args=(self._shm.name, shape, use_color, self._shared_ready,
+                  self._shared_seq, ready, self._capture_stop),
+            daemon=True)
+        self.capture_process.start()
+        
+        if not ready.wait(timeout=10.0) or self._shared_seq.value < 0:
+            self._stop_capture_process()
+            return False
+        
+        print(f"- Capture process started (PID {self.capture_process.pid})")
+        return True
+    
+    def _read_shared_frame(self):
+        """Copy the newest frame published by the capture process"""
+        frame = self._acquire_frame(self._shared_frame.shape)
+        with self._shared_ready:
+            # 等待采集进程发布新帧的通知，最多100ms (不再以1ms间隔轮询)
+            if not self._shared_ready.wait_for(
+                    lambda: self._shared_seq.value != self._last_shared_seq, timeout=0.1):
+                self._recycle_frame(frame)
+                return False, None
+            np.copyto(frame, self._shared_frame)
+            self._last_shared_seq = self._shared_seq.value
+        return True, frame
+    
+    def _stop_capture_process(self):
+        """Stop the capture process and release shared memory"""
+        self._capture_stop.set()
+        self.capture_process.join(timeout=2.0)
+        if self.capture_process.is_alive():
+            self.capture_process.terminate()
+        
+        del self._shared_frame
+        self._shm.close()
+        self._shm.unlink()
+        self.capture_process = None
+    
     def init_uart(self, baud_rate):
         """Initialize UART serial port"""
         try:
@@ -488,6 +810,12 @@ class WebPSender:
             self.ser_sender.reset_input_buffer()
             self.ser_sender.reset_output_buffer()
             
+            # 启用低延迟模式 (USB串口芯片延迟定时器 ~16ms → 1ms)
+            self._enable_low_latency()
+            
+            # 扩大驱动侧缓冲区，整帧数据可以一次交给驱动
+            self._set_driver_buffer_size()
+            
             print(f"✅ Sender serial port initialization successful ({SENDER_PORT} @ {baud_rate}bps)")
             
             # Apply UART speed optimizations
@@ -543,50 +871,75 @@ class WebPSender:
             
         print("🤝 Preparing handshake packets...")
         
-        # 预生成10个握手包
+        # 预生成10个握手包，收集后一次性拼接
+        parts = []
+        type_bytes = self._type_fields[HANDSHAKE_TYPE]
         for i in range(10):
             if USE_SIMPLIFIED_PROTOCOL:
-                magic = PROTOCOL_MAGIC
-                hs_marker = b'HS'
-                counter = struct.pack('<H', i % 65536)
-                packet = magic + hs_marker + counter
+                parts.append(HANDSHAKE_HEADER.pack(PROTOCOL_MAGIC, b'HS', i))
             else:
-                magic = PROTOCOL_MAGIC
-                handshake_id = struct.pack('<I', i)
-                timestamp = struct.pack('<I', int(time.time() * 1000) % 1000000)
-                type_bytes = "HNDSHK".ljust(8)[:8].encode('ascii')
                 payload = f"HANDSHAKE-{i}".encode('ascii')
-                length = struct.pack('<I', len(payload))
                 packet_hash = self.calculate_frame_hash(payload)
-                packet = magic + handshake_id + length + type_bytes + packet_hash + payload
-                
-            self.handshake_buffer += packet
+                parts.append(FULL_HEADER.pack(PROTOCOL_MAGIC, i, len(payload), type_bytes, packet_hash))
+                parts.append(payload)
+        self.handshake_buffer = b''.join(parts)
+        
+        # 按包切出memoryview，发送时直接写入，不再每次切片复制
+        view = memoryview(self.handshake_buffer)
+        packet_size = len(self.handshake_buffer) // 10  # 10个包长度相同
+        self._handshake_packets = [view[i * packet_size:(i + 1) * packet_size] for i in range(10)]
         
         print(f"✅ Prepared {len(self.handshake_buffer)} bytes of handshake data")
     
+    def _set_driver_buffer_size(self):
+        """Enlarge the serial driver's RX/TX queues (Windows only)"""
+        # pyserial只在Windows上提供set_buffer_size (SetupComm)
+        if not hasattr(self.ser_sender, 'set_buffer_size'):
+            return
+        try:
+            self.ser_sender.set_buffer_size(rx_size=UART_BUFFER_SIZE, tx_size=UART_BUFFER_SIZE)
+            print(f"- Serial driver buffers: {UART_BUFFER_SIZE/1024:.0f}KB")
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Serial driver buffer size not supported: {e}")
+    
+    def _enable_low_latency(self):
+        """Enable ASYNC_LOW_LATENCY on the serial device (Linux only)"""
+        # pyserial只在Linux上提供set_low_latency_mode
+        if not hasattr(self.ser_sender, 'set_low_latency_mode'):
+            return
+        try:
+            self.ser_sender.set_low_latency_mode(True)
+            print("- Serial low-latency mode enabled")
+        except (ValueError, OSError) as e:
+            # 部分设备(如板载UART)不支持该设置，忽略即可
+            print(f"⚠️ Serial low-latency mode not supported: {e}")
+    
     def init_wireless(self):
         """Initialize wireless connection"""
+        if self.wireless_transport == 'udp':
+            return self._init_wireless_udp()
+        
         try:
             # Create TCP server socket with optimizations
             self.wireless_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             
-            # 性能优化
+            # 性能优化 - 所有速率都禁用Nagle算法并设置发送缓冲区
+            # 设置更大的发送缓冲区
+            self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TCP_BUFFER_SIZE)
+            
+            # 禁用Nagle算法，减少延迟 (小帧不会再被延迟~40ms)
+            if TCP_NODELAY:
+                self.wireless_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
             if self.baud_rate >= 1000000:
-                # 对于高速网络，启用更多优化
-                # 设置更大的发送缓冲区
-                self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TCP_BUFFER_SIZE)
-                
-                # 禁用Nagle算法，减少延迟
-                if TCP_NODELAY:
-                    self.wireless_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                
                 # 设置socket超时
                 self.wireless_socket.settimeout(SOCKET_TIMEOUT)
-                
-                print(f"🔧 TCP Socket optimized for high-speed transmission:")
-                print(f"   - Send buffer: {TCP_BUFFER_SIZE/1024:.0f}KB")
-                print(f"   - TCP_NODELAY: {TCP_NODELAY}")
+            
+            print(f"🔧 TCP Socket optimized for low-latency transmission:")
+            print(f"   - Send buffer: {TCP_BUFFER_SIZE/1024:.0f}KB")
+            print(f"   - TCP_NODELAY: {TCP_NODELAY}")
+            if self.baud_rate >= 1000000:
                 print(f"   - Timeout: {SOCKET_TIMEOUT}s")
             
             # 服务器角色 - 绑定和监听连接
@@ -609,16 +962,14 @@ class WebPSender:
                 self.client_socket, client_address = self.wireless_socket.accept()
                 print(f"✅ Client connected: {client_address}")
                 
-                # 为客户端连接设置优化参数
-                if self.baud_rate >= 1000000:
-                    # 设置非阻塞模式
-                    self.client_socket.setblocking(False)
-                    
-                    # 这些设置可能不会全部生效，因为连接已经建立，但尝试应用
-                    try:
-                        self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                    except:
-                        pass
+                # 为客户端连接设置优化参数 (accept返回的socket需要单独设置)
+                self._optimize_client_socket()
+                
+                # 非阻塞模式：发送缓冲区满时由_send_wireless等待可写
+                # 选择器只注册一次 (Linux上为epoll)，不必每次等待都重建fd集合
+                self.client_socket.setblocking(False)
+                self._write_selector = selectors.DefaultSelector()
+                self._write_selector.register(self.client_socket, selectors.EVENT_WRITE)
                 
                 return True
             except socket.timeout:
@@ -628,73 +979,130 @@ class WebPSender:
             print(f"❌ Wireless initialization failed: {e}")
             return False
     
+    def _init_wireless_udp(self):
+        """Initialize UDP wireless endpoint"""
+        try:
+            self.wireless_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.wireless_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TCP_BUFFER_SIZE)
+            self.wireless_socket.bind((WIRELESS_HOST, WIRELESS_PORT))
+            
+            print(f"🌐 Wireless UDP endpoint started, waiting for receiver...")
+            print(f"   Address: {WIRELESS_HOST}:{WIRELESS_PORT}")
+            print(f"   Speed: {self.baud_rate/1000}K bps")
+            
+            # UDP无连接 - 通过接收端发来的注册包获知其地址
+            self.wireless_socket.settimeout(10.0)
+            print("   Waiting for receiver to register... (10s timeout)")
+            try:
+                data, address = self.wireless_socket.recvfrom(64)
+                while data != UDP_HELLO:
+                    data, address = self.wireless_socket.recvfrom(64)
+            except socket.timeout:
+                print("❌ Registration timed out. Make sure the receiver is running with UDP transport.")
+                return False
+            
+            self.udp_peer = address
+            self.wireless_socket.settimeout(SOCKET_TIMEOUT)
+            print(f"✅ Receiver registered: {address}")
+            return True
+        except Exception as e:
+            print(f"❌ Wireless initialization failed: {e}")
+            return False
+    
+    def _optimize_client_socket(self):
+        """Apply TCP low-latency options to the accepted client socket"""
+        try:
+            # 禁用Nagle算法
+            if TCP_NODELAY:
+                self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
+            # 设置发送缓冲区
+            self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, TCP_BUFFER_SIZE)
+            
+            # Linux: 立即回复ACK，减少往返延迟
+            if hasattr(socket, 'TCP_QUICKACK'):
+                self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        except OSError as e:
+            print(f"⚠️ Client socket optimization failed: {e}")
+    
     def encode_frame_webp(self, frame):
         """Optimized WebP encoding"""
         try:
-            # Convert to PIL Image
-            if len(frame.shape) == 3:  # 彩色图像
-                pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            else:  # 灰度图像
-                pil_image = Image.fromarray(frame)
-            
-            # 根据是否是1MHz优化模式选择不同的编码参数
-            if self.optimized_for_1mhz:
-                # 1MHz模式下的优化编码参数
-                buffer = io.BytesIO()
-                pil_image.save(
-                    buffer, 
-                    format='WebP', 
-                    quality=self.current_quality,
-                    method=self.webp_method,
-                    lossless=False,
-                    exact=False,  # Allow quality adjustment for better compression
-                    # 添加更多优化参数
-                    minimize_size=True,  # 最小化文件大小
-                    kmin=2,  # 降低最小分区大小以提高压缩率
-                    kmax=4   # 限制最大分区以保持速度
-                )
+            start_time = time.perf_counter()
+            if self.webp_method != CV2_WEBP_METHOD:
+                # 需要其他method时通过Pillow编码 (method 0-2比默认的4快2-4倍)
+                webp_data = self._encode_webp_pil(frame)
             else:
-                # 常规WebP压缩
-                buffer = io.BytesIO()
-                pil_image.save(
-                    buffer, 
-                    format='WebP', 
-                    quality=self.current_quality,
-                    method=self.webp_method,
-                    lossless=False,
-                    exact=False  # Allow quality adjustment for better compression
-                )
-            
-            webp_data = buffer.getvalue()
+                # 直接通过OpenCV调用libwebp编码BGR/灰度数组
+                # 省去PIL的BGR→RGB转换、Image.fromarray拷贝和BytesIO拷贝
+                ok, buffer = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, int(self.current_quality)])
+                if not ok:
+                    print_throttled('encode', "❌ WebP encoding failed: cv2.imencode returned False")
+                    return None
+                
+                webp_data = buffer.tobytes()
             
-            # Calculate compression ratio (for statistics only)
-            if len(self.stats['compression_ratios']) % 10 == 0:  # Calculate every 10 frames
-                original_size = frame.nbytes
-                webp_size = len(webp_data)
-                compression_ratio = original_size / webp_size
-                self.stats['compression_ratios'].append(compression_ratio)
+            # 编码耗时既用于自适应method，也作为质量控制器的编码预算信号
+            self.stats['encode_times'].append(time.perf_counter() - start_time)
+            if ADAPTIVE_WEBP_METHOD:
+                self._adapt_webp_method()
             
-            self.stats['packet_sizes'].append(len(webp_data))
+            # 压缩比和包大小每帧都记录 (只是一次除法和两次O(1)追加)
+            # 原来按 len(...) % 10 采样，记录第一帧后长度为1，之后再也不会更新
+            webp_size = len(webp_data)
+            self.stats['compression_ratios'].append(frame.nbytes / webp_size)
+            self.stats['packet_sizes'].append(webp_size)
             
             return webp_data
             
         except Exception as e:
-            print(f"❌ WebP encoding failed: {e}")
+            print_throttled('encode', f"❌ WebP encoding failed: {e}")
             return None
     
+    def _adapt_webp_method(self):
+        """Trade WebP encoder effort (method) against the measured encode time"""
+        # 只在编码线程中调用，采样窗口和webp_method不会被并发修改
+        encode_times = self.stats['encode_times']
+        if len(encode_times) < 20:
+            return
+        
+        avg_encode_time = encode_times.mean
+        if avg_encode_time > self.current_fps_delay * 0.5 and self.webp_method > 0:
+            # 编码占用超过半个帧周期，降低method换取速度
+            self.webp_method -= 1
+        elif (avg_encode_time < self.current_fps_delay * 0.3 and self.webp_method < 6 and
+              self.stats['packet_sizes'].mean > self.target_packet_size):
+            # 编码时间充裕而包偏大，提高method换取更小的包
+            self.webp_method += 1
+        else:
+            return
+        
+        # 新method重新采样，旧的耗时不再有参考价值
+        encode_times.clear()
+        print(f"⚙️ WebP method → {self.webp_method} (encode {avg_encode_time*1000:.1f}ms, "
+              f"frame period {self.current_fps_delay*1000:.1f}ms)")
+    
+    def _encode_webp_pil(self, frame):
+        """WebP encoding through Pillow with an explicit method"""
+        height, width = frame.shape[:2]
+        if frame.ndim == 2:
+            image = Image.frombuffer('L', (width, height), frame, 'raw', 'L', 0, 1)
+        else:
+            # 直接按BGR解析原始缓冲区，不需要cvtColor转换为RGB
+            image = Image.frombuffer('RGB', (width, height), frame, 'raw', 'BGR', 0, 1)
+        
+        # 复用输出缓冲区，清空后写入本帧，避免每帧新建BytesIO及其扩容
+        output = self._webp_output
+        output.seek(0)
+        output.truncate()
+        image.save(output, 'WEBP', quality=int(self.current_quality), method=self.webp_method)
+        return output.getvalue()
+    
     def calculate_frame_hash(self, frame_data):
         """Calculate frame data hash for verification"""
-        if USE_SIMPLIFIED_PROTOCOL:
-            # 使用简单的校验和代替MD5哈希，减少计算开销
-            checksum = 0
-            # 每1024字节采样一次以加快计算速度
-            for i in range(0, len(frame_data), 1024):
-                chunk = frame_data[i:i+1024]
-                checksum = (checksum + sum(chunk)) & 0xFFFFFFFF
-            return struct.pack('<I', checksum)
-        else:
-            # 原始MD5哈希方法
-            return hashlib.md5(frame_data).digest()[:4]
+        # CRC32校验 (zlib使用硬件加速CRC指令)，比MD5快得多且只需要4字节
+        return CRC32.pack(zlib.crc32(frame_data))
     
     def send_packet(self, packet_data, packet_type=PACKET_TYPE):
         """Send data packet"""
@@ -702,108 +1110,129 @@ class WebPSender:
             if USE_SIMPLIFIED_PROTOCOL:
                 # 简化的协议头: Magic(2) + Length(2) + Hash(4) + Data
                 # 总共减少了10字节的头部开销
-                magic = PROTOCOL_MAGIC
                 # 使用2字节表示长度，最大支持65535字节
-                length = struct.pack('<H', len(packet_data))
-                packet_hash = self.calculate_frame_hash(packet_data)
-                
-                # 组装简化的数据包
-                packet = magic + length + packet_hash + packet_data
+                SIMPLE_HEADER.pack_into(self._header, 0, PROTOCOL_MAGIC, len(packet_data),
+                                        self.calculate_frame_hash(packet_data))
+                header = memoryview(self._header)[:SIMPLE_HEADER.size]
             else:
-                # 原始协议: Magic(4) + FrameID(4) + Length(4) + Type(8) + Hash(4) + Data
-                magic = PROTOCOL_MAGIC
-                frame_id = struct.pack('<I', self.frame_counter)
-                length = struct.pack('<I', len(packet_data))
-                type_bytes = packet_type.ljust(8)[:8].encode('ascii')
-                packet_hash = self.calculate_frame_hash(packet_data)
-                
-                # 组装完整的数据包
-                packet = magic + frame_id + length + type_bytes + packet_hash + packet_data
+                # 原始协议: Magic + FrameID(4) + Length(4) + Type(8) + Hash(4) + Data
+                type_bytes = self._type_fields.get(packet_type) or packet_type.ljust(8)[:8].encode('ascii')
+                FULL_HEADER.pack_into(self._header, 0, PROTOCOL_MAGIC, self.frame_counter,
+                                      len(packet_data), type_bytes,
+                                      self.calculate_frame_hash(packet_data))
+                header = memoryview(self._header)[:FULL_HEADER.size]
             
-            # Send data according to transmission mode
-            if self.transmission_mode == 'uart':
-                # UART mode - Send entire packet at once instead of byte by byte
-                # This is crucial for reducing TX blinking and improving efficiency
-                bytes_written = self.ser_sender.write(packet)
-                
-                # Only flush after complete packet
-                self.ser_sender.flush()
-                
-                if bytes_written != len(packet):
-                    print(f"⚠️ Incomplete send: {bytes_written}/{len(packet)} bytes")
-                    return False
-            elif self.transmission_mode == 'wireless':
-                # 高速模式 (>1MHz) - 完全不等待，最大限度利用网络
-                if self.baud_rate >= 2000000:
-                    # 直接发送，不等待
-                    try:
-                        # 尝试非阻塞发送
-                        self.client_socket.sendall(packet)
-                    except socket.error as e:
-                        if str(e).find('10035') >= 0:  # WSAEWOULDBLOCK
-                            # 如果缓冲区已满，等待一小段时间
-                            time.sleep(0.001)
-                            return True  # 仍然视为成功
-                        else:
-                            print(f"⚠️ Socket send warning: {e}")
-                            time.sleep(0.01)
-                            return False
-                # Wireless mode - 优化1MHz传输
-                elif self.baud_rate == 1000000 and self.optimized_for_1mhz:
-                    # 1MHz优化模式：减少速率控制的限制，增加突发传输能力
-                    if self.wireless_controller:
-                        delay = self.wireless_controller.calculate_delay(len(packet))
-                        # 减少等待时间以提高吞吐量
-                        if delay > 0:
-                            time.sleep(delay * 0.7)  # 只等待计算延迟的70%
-                else:
-                    # 常规模式
-                    if self.wireless_controller:
-                        delay = self.wireless_controller.calculate_delay(len(packet))
-                        if delay > 0:
-                            time.sleep(delay)
-                
-                # 使用更大的发送缓冲区
-                try:
-                    self.client_socket.sendall(packet)
-                except socket.error as e:
-                    print(f"⚠️ Socket send warning: {e}")
-                    time.sleep(0.01)
-                    return False
-            else:  # hybrid mode - send video data over wireless
-                # 同样优化1MHz传输
-                if self.baud_rate == 1000000 and self.optimized_for_1mhz:
-                    # 1MHz优化模式
-                    if self.wireless_controller:
-                        delay = self.wireless_controller.calculate_delay(len(packet))
-                        if delay > 0:
-                            time.sleep(delay * 0.7)  # 只等待计算延迟的70%
-                else:
-                    # 常规模式
-                    if self.wireless_controller:
-                        delay = self.wireless_controller.calculate_delay(len(packet))
-                        if delay > 0:
-                            time.sleep(delay)
-                
-                # 使用更大的发送缓冲区
-                try:
-                    self.client_socket.sendall(packet)
-                except socket.error as e:
-                    print(f"⚠️ Socket send warning: {e}")
-                    time.sleep(0.01)
-                    return False
+            # 头部和数据分开传递，不再为每帧拼接出一个新的bytes对象
+            packet_size = len(header) + len(packet_data)
+            
+            # Send data according to transmission mode (发送路径在初始化时已选定)
+            if not self._transmit(header, packet_data, packet_size):
+                # 传输路径内部已处理的失败 (套接字错误、写入不完整) 同样计入连续错误，
+                # 供恢复模式和(m,k)-firm丢帧判断
+                self.error_count += 1
+                return False
             
             self.stats['frames_sent'] += 1
-            self.stats['bytes_sent'] += len(packet)
+            self.stats['bytes_sent'] += packet_size
             
             return True
             
         except Exception as e:
-            print(f"❌ Send failed: {e}")
+            print_throttled('send', f"❌ Send failed: {e}")
             self.stats['errors'] += 1
             self.error_count += 1
             return False
     
+    def _select_transmit(self):
+        """Pick the send path for this transmission mode and rate"""
+        if self.transmission_mode == 'uart':
+            return self._transmit_uart
+        # 2MHz及以上不限速 (混合模式没有速率控制器)
+        if self.wireless_controller is None or self.baud_rate >= 2000000:
+            return self._transmit_wireless
+        return self._transmit_wireless_paced
+    
+    def _transmit_uart(self, header, packet_data, packet_size):
+        """UART mode - send the entire packet with a single write"""
+        # This is crucial for reducing TX blinking and improving efficiency
+        # 不再每包flush()：flush会阻塞等待TX FIFO排空(tcdrain)，
+        # 驱动会自行发送缓冲区中的数据
+        # 头部和数据复制到复用的发送缓冲区，一次write写出整包
+        header_size = len(header)
+        self._packet_buffer[:header_size] = header
+        self._packet_buffer[header_size:packet_size] = packet_data
+        bytes_written = self.ser_sender.write(memoryview(self._packet_buffer)[:packet_size])
+        
+        if bytes_written != packet_size:
+            print_throttled('send', f"⚠️ Incomplete send: {bytes_written}/{packet_size} bytes")
+            return False
+        return True
+    
+    def _transmit_wireless_paced(self, header, packet_data, packet_size):
+        """Wireless mode below 2MHz - wait for the rate controller, then send"""
+        delay = self.wireless_controller.calculate_delay(packet_size)
+        if delay > 0:
+            # 1MHz优化模式：只等待计算延迟的70%，提高突发传输能力
+            # (少等的部分由令牌桶记账，下一个包会相应多等)
+            time.sleep(delay * 0.7 if self.optimized_for_1mhz else delay)
+        return self._transmit_wireless(header, packet_data, packet_size)
+    
+    def _transmit_wireless(self, header, packet_data, packet_size):
+        """Wireless/hybrid mode - send video data over the socket"""
+        try:
+            self._send_wireless(header, packet_data)
+        except socket.error as e:
+            print_throttled('send', f"⚠️ Socket send warning: {e}")
+            time.sleep(0.01)
+            return False
+        return True
+    
+    def _send_wireless(self, *buffers):
+        """Write header and payload buffers to the wireless socket"""
+        if self.udp_peer is not None:
+            # UDP: 每个数据包一个数据报，前置4字节序列号供接收端检测丢包
+            seq = UDP_SEQ.pack(self.udp_seq)
+            if self._has_sendmsg:
+                self.wireless_socket.sendmsg((seq,) + buffers, (), 0, self.udp_peer)
+            else:
+                self.wireless_socket.sendto(b''.join((seq,) + buffers), self.udp_peer)
+            self.udp_seq = (self.udp_seq + 1) & 0xFFFFFFFF
+            return
+        
+        # TCP: sendmsg分散/聚集写入，头部和数据无需先拼接
+        views = [memoryview(b) for b in buffers]
+        total = sum(len(v) for v in views)
+        while views:
+            try:
+                if self._has_sendmsg:
+                    sent = self.client_socket.sendmsg(views)
+                else:
+                    sent = self.client_socket.send(views[0])
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            
+            # 跳过已发送的部分 (可能只发送了一部分)
+            while sent and views:
+                if sent >= len(views[0]):
+                    sent -= len(views[0])
+                    views.pop(0)
+                else:
+                    views[0] = views[0][sent:]
+                    sent = 0
+            
+            if views:
+                # 发送缓冲区已满 - 等待可写，期间释放GIL让其他线程运行
+                if not self._write_selector.select(SOCKET_TIMEOUT):
+                    pending = sum(len(v) for v in views)
+                    if pending == total:
+                        # 本包一个字节都还没发出，可以整包放弃，数据流仍然对齐
+                        raise socket.timeout(f"send stalled with {pending} bytes pending")
+                    # 已发出部分数据：放弃会让接收端从半个包处开始解析，必须发完本包
+                    # (与原来阻塞的sendall一致)，只在停止发送时中止
+                    if not self.running:
+                        raise ConnectionAbortedError(f"sender stopped with {pending} bytes of a packet pending")
+                    print_throttled('send', f"⚠️ Send stalled mid-packet, {pending}/{total} bytes pending")
+    
     def send_handshake_packet(self):
         """Send handshake packet over UART in hybrid mode"""
         try:
@@ -811,62 +1240,33 @@ class WebPSender:
             if not self.ser_sender or not self.ser_sender.is_open:
                 return False
             
-            # 使用预生成的握手包或生成新的
-            if len(self.handshake_buffer) > 0 and self.handshake_counter % 10 < 5:
-                packet_index = self.handshake_counter % 10
-                if USE_SIMPLIFIED_PROTOCOL:
-                    packet_size = 6  # Magic(2) + 'HS'(2) + Counter(2)
-                else:
-                    # 计算原始协议的包大小
-                    packet_size = 24 + len(f"HANDSHAKE-{packet_index}".encode('ascii'))
-                
-                packet = self.handshake_buffer[packet_index * packet_size:(packet_index + 1) * packet_size]
-            else:
-                # 生成新的握手包
-                if USE_SIMPLIFIED_PROTOCOL:
-                    # 简化协议: Magic(2) + 'HS'(2) + Counter(2)
-                    magic = PROTOCOL_MAGIC
-                    hs_marker = b'HS'
-                    counter = struct.pack('<H', self.handshake_counter % 65536)
-                    packet = magic + hs_marker + counter
-                else:
-                    # 原始握手包格式
-                    magic = PROTOCOL_MAGIC
-                    handshake_id = struct.pack('<I', self.handshake_counter)
-                    timestamp = struct.pack('<I', int(time.time() * 1000) % 1000000)
-                    type_bytes = "HNDSHK".ljust(8)[:8].encode('ascii')
-                    
-                    # Simple payload with counter
-                    payload = f"HANDSHAKE-{self.handshake_counter}".encode('ascii')
-                    length = struct.pack('<I', len(payload))
-                    packet_hash = self.calculate_frame_hash(payload)
-                    
-                    packet = magic + handshake_id + length + type_bytes + packet_hash + payload
+            # 始终轮流发送预生成的握手包 (接收端只关心握手是否到达，计数器仅作标识)
+            # 不再每隔5次重新打包、计算哈希和格式化负载
+            packet = self._handshake_packets[self.handshake_counter % 10]
             
             # 发送前确保串口可用
             if self.ser_sender and self.ser_sender.is_open:
-                # 使用写入优先级
+                # 握手包只有几个字节，交给驱动自行发送，不再flush()阻塞等待排空
                 self.ser_sender.write(packet)
-                self.ser_sender.flush()
                 
                 self.handshake_counter += 1
                 self.stats['handshakes_sent'] += 1
                 return True
             return False
         except Exception as e:
-            print(f"❌ Handshake send failed: {e}")
+            print_throttled('handshake', f"❌ Handshake send failed: {e}")
             return False
     
     def handshake_thread_func(self):
         """Thread function for sending handshake packets at regular intervals in hybrid mode"""
         print(f"🤝 Starting handshake thread with {self.handshake_interval*1000:.1f}ms interval")
         
-        # 使用更稳定的计时方法
-        next_time = time.time()
+        # 使用单调时钟的绝对截止时间调度 (不受系统时间调整影响，也不会累积漂移)
+        next_time = time.monotonic()
         
         # 错误计数和恢复机制
         error_count = 0
-        last_success_time = time.time()
+        last_success_time = next_time
         
         # 动态调整发送间隔
         dynamic_interval = self.handshake_interval
@@ -876,12 +1276,13 @@ class WebPSender:
         # 握手计数器用于调试
         handshake_send_counter = 0
         
-        while self.handshake_running:
+        stop_event = self._handshake_stop
+        while not stop_event.is_set():
             try:
-                current_time = time.time()
+                current_time = time.monotonic()
                 if current_time >= next_time:
                     handshake_send_counter += 1
-                    if handshake_send_counter % 20 == 0:  # 每20次打印一次状态
+                    if HANDSHAKE_STATUS_LOG and handshake_send_counter % 20 == 0:  # 每20次打印一次状态
                         print(f"🤝 Sending handshakes: {handshake_send_counter} (interval: {dynamic_interval*1000:.1f}ms)")
                     
                     if self.send_handshake_packet():
@@ -914,195 +1315,394 @@ class WebPSender:
                                 pass
                             error_count = 0
                     
-                    # 计算下一次发送时间，使用动态间隔
-                    next_time = current_time + dynamic_interval
+                    # 计算下一次发送时间：在上一个截止时间上累加，发送耗时不会推迟后续握手
+                    next_time += dynamic_interval
+                    if next_time < current_time:
+                        # 已落后于计划 (例如串口重置)，重新同步，避免连续补发
+                        next_time = current_time + dynamic_interval
                 else:
-                    # 短暂休眠，避免CPU占用过高
-                    sleep_time = min(0.001, (next_time - current_time) / 2)
-                    time.sleep(sleep_time)
+                    # 等待到截止时间，不再以1ms间隔轮询；stop()时立即返回
+                    stop_event.wait(next_time - current_time)
             except Exception as e:
                 print(f"❌ Handshake thread error: {e}")
                 time.sleep(0.01)  # 出错时短暂休眠
     
-    def adjust_quality_smart(self):
-        """Smart quality adjustment"""
-        if len(self.frame_buffer) >= 10:
-            recent_frames = list(self.frame_buffer)[-10:]
-            success_rate = sum(1 for f in recent_frames if f['success']) / len(recent_frames)
-            avg_size = sum(f['size'] for f in recent_frames) / len(recent_frames)
-            
-            # Calculate actual frame rate
-            if len(self.stats['fps_history']) >= 5:
-                recent_fps = np.mean(list(self.stats['fps_history'])[-5:])
-            else:
-                recent_fps = 0
-            
-            # Get statistics
-            avg_compression = np.mean(list(self.stats['compression_ratios'])) if self.stats['compression_ratios'] else 1.0
-            avg_packet_size = np.mean(list(self.stats['packet_sizes'])) if self.stats['packet_sizes'] else 2000
-            
-            # UART模式专用优化策略
-            if self.transmission_mode == 'uart':
-                target_fps = 1.0 / self.current_fps_delay  # 目标帧率
+    def _record_frame(self, size, success):
+        """Record one frame's size and send result in the ring buffer"""
+        i = self._fb_count % FRAME_HISTORY_SIZE
+        self._fb_size[i] = size
+        self._fb_ok[i] = success
+        self._fb_count += 1
+    
+    def _link_failing(self):
+        """(m,k)-firm check: fewer than m of the last k frames went out and errors continue"""
+        if self.error_count <= 2 or self._fb_count < MK_FIRM_WINDOW:
+            return False
+        recent = np.arange(self._fb_count - MK_FIRM_WINDOW, self._fb_count) % FRAME_HISTORY_SIZE
+        return self._fb_ok[recent].sum() < MK_FIRM_MIN_SUCCESS
+    
+    def _quality_range(self):
+        """Quality limits of the current transmission mode"""
+        if self.transmission_mode == 'uart':
+            return 20, 70
+        if self.transmission_mode == 'wireless':
+            return 25, 85  # Wireless mode allows higher quality
+        return 20, (80 if self.performance_mode == "high_quality" else 60)
+    
+    def adjust_quality_smart(self, oversized_size=None):
+        """Smart quality adjustment - PI control of quality against the link/encode budget"""
+        if self._fb_count < 10:
+            return
+        
+        # 最近10帧在环形缓冲区中的位置
+        recent = np.arange(self._fb_count - 10, self._fb_count) % FRAME_HISTORY_SIZE
+        success_rate = self._fb_ok[recent].mean()
+        recent_sizes = self._fb_size[recent]
+        size_mean = recent_sizes.mean()
+        
+        # 包大小波动大 (变异系数高) 时平均值不可靠，只允许降低质量不允许提高
+        stable = size_mean > 0 and recent_sizes.std() <= QUALITY_STABILITY_CV * size_mean
+        
+        # Calculate actual frame rate
+        if len(self.stats['fps_history']) >= 5:
+            recent_fps = self.stats['fps_history'].mean
+        else:
+            recent_fps = 0
+        target_fps = 1.0 / self.current_fps_delay  # 目标帧率
+        is_wireless = self.transmission_mode == 'wireless'
+        
+        # 负载 = 实际开销 / 预算 (1.0为刚好用满)，取包大小、编码耗时中最紧的一项
+        # 无线模式对包大小更宽松 (允许1.5倍)，但帧率不足也视为超出预算
+        byte_budget = self.target_packet_size * (1.5 if is_wireless else 1.0)
+        load = size_mean / byte_budget
+        if oversized_size is not None:
+            # 超出链路预算而被丢弃的帧没有进入发送统计，直接计入负载
+            load = max(load, oversized_size / byte_budget)
+        encode_times = self.stats['encode_times']
+        if encode_times:
+            load = max(load, encode_times.mean / (self.current_fps_delay * QUALITY_ENCODE_BUDGET))
+        if is_wireless and recent_fps > 0:
+            load = max(load, target_fps * 0.8 / recent_fps)
+        
+        # 负载偏差：正值表示有余量可以提高质量，负值表示超出预算
+        error = min(1.0, max(-2.0, 1.0 - load))
+        if success_rate < 0.9:
+            # 发送失败说明链路已饱和，无论包大小如何都按超出预算处理
+            error = max(-2.0, min(error, (success_rate - 0.9) * 5))
+        if error > 0 and not stable:
+            error = 0.0
+        
+        # 增量式PI: Δq = Kp·(e_k - e_{k-1}) + Ki·e_k
+        # 质量本身就是积分器，外部对质量的直接调整 (恢复模式) 会被保留
+        delta = (QUALITY_PI_KP * (error - self._quality_error) + QUALITY_PI_KI * error +
+                 self._quality_residual)
+        self._quality_error = error
+        step = int(round(delta))
+        q_min, q_max = self._quality_range()
+        new_quality = min(q_max, max(q_min, self.current_quality + step))
+        # 抗积分饱和：触及质量上下限时丢弃未满一级的累积量
+        if new_quality == self.current_quality + step:
+            self._quality_residual = delta - step
+        else:
+            self._quality_residual = 0.0
+        
+        if new_quality < self.current_quality:
+            self.current_quality = new_quality
+            print(f"📉 Reduce quality: Q{self.current_quality} (load {load:.2f}, success {success_rate:.0%})")
+        elif new_quality > self.current_quality:
+            self.current_quality = new_quality
+            print(f"📈 Improve quality: Q{self.current_quality} (load {load:.2f})")
+        
+        # 帧间隔仍按各模式的规则调整 (质量由上面的PI控制)
+        if self.transmission_mode == 'uart':
+            if success_rate < 0.9:
+                # 传输成功率低，轻微增加延迟
+                self.current_fps_delay = min(0.15, self.current_fps_delay * 1.05)
+            elif load < 0.7 and success_rate > 0.95 and stable and recent_fps < target_fps * 0.8:
+                # 有余量但帧率不足，降低延迟
+                self.current_fps_delay = max(0.02, self.current_fps_delay * 0.95)
+                print(f"📈 Improve FPS: delay {self.current_fps_delay*1000:.1f}ms")
+        elif is_wireless:
+            if success_rate < 0.8:
+                # Don't easily increase delay in wireless mode
+                self.current_fps_delay = min(self.current_fps_delay * 1.2, 0.1)
+            elif success_rate > 0.98 and recent_fps > target_fps * 0.9 and load < 1.0 and stable:
+                # Try to improve frame rate
+                self.current_fps_delay = max(0.01, self.current_fps_delay * 0.95)
+        else:
+            if success_rate < 0.8 or load > 1.2:
+                self.current_fps_delay = min(0.2, self.current_fps_delay + 0.01)
+            elif success_rate > 0.95 and load < 0.8 and stable:
+                self.current_fps_delay = max(0.02, self.current_fps_delay - 0.005)
+        
+        if QUALITY_STATUS_LOG:
+            avg_compression = self.stats['compression_ratios'].mean if self.stats['compression_ratios'] else 1.0
+            print(f"📊 Send status: Q={self.current_quality}, Compression={avg_compression:.1f}x, "
+                  f"Packet size={size_mean:.0f}B, FPS={recent_fps:.1f}fps, "
+                  f"Success rate={success_rate:.2%}")
+    
+    def _acquire_frame(self, shape):
+        """Take a frame buffer from the pool, or allocate a new one"""
+        try:
+            frame = self._frame_pool.pop()
+            if frame.shape == shape:
+                return frame
+        except IndexError:
+            pass
+        return np.empty(shape, dtype=np.uint8)
+    
+    def _recycle_frame(self, frame):
+        """Return a frame buffer to the pool once no stage uses it"""
+        # 队列中的帧 + 编码中的帧 + 采集中的帧
+        if len(self._frame_pool) < PIPELINE_QUEUE_SIZE + 2:
+            self._frame_pool.append(frame)
+    
+    def _drop_encoded(self, encoded_data):
+        """Count encoded frames pushed out of a full send queue"""
+        self.stats['frames_dropped'] += 1
+    
+    def capture_thread(self):
+        """Capture thread - grab and preprocess frames for the encoder"""
+        print("📷 Capture thread started")
+        
+        # 热路径上用到的属性/函数绑定为局部变量
+        read_frame = self._read_frame
+        acquire = self._acquire_frame
+        put_frame = self._capture_queue.put
+        resize = cv2.resize
+        cvt_color = cv2.cvtColor
+        color_bgr2gray = cv2.COLOR_BGR2GRAY
+        frame_size = (self.frame_width, self.frame_height)
+        frame_shape = (self.frame_height, self.frame_width)
+        frame_pixels = self.frame_height * self.frame_width
+        resized_buf = self._resized
+        use_color = self.use_color
+        
+        while self.running:
+            try:
+                # Capture frame
+                ret, frame = read_frame()
+                if not ret:
+                    time.sleep(0.01)
+                    continue
                 
-                # 主要根据包大小调整质量，避免过度增加延迟
-                if avg_packet_size > self.target_packet_size * 1.5:
-                    # 包过大，降低质量但不增加延迟
-                    self.current_quality = max(20, self.current_quality - 3)
-                    print(f"📉 Reduce quality: Q{self.current_quality} (packet size too large)")
-                elif success_rate < 0.9:
-                    # 传输成功率低，轻微增加延迟
-                    self.current_quality = max(20, self.current_quality - 3)
-                    self.current_fps_delay = min(0.15, self.current_fps_delay * 1.05)
-                    print(f"📉 Reduce quality: Q{self.current_quality} (low success rate)")
-                elif avg_packet_size < self.target_packet_size * 0.7 and success_rate > 0.95:
-                    # 包较小且成功率高，可以提高质量或降低延迟
-                    if recent_fps < target_fps * 0.8:
-                        # 帧率不足，降低延迟
-                        self.current_fps_delay = max(0.02, self.current_fps_delay * 0.95)
-                        print(f"📈 Improve FPS: delay {self.current_fps_delay*1000:.1f}ms")
+                # 先缩放再转灰度，cvtColor只需处理目标分辨率的像素
+                # 摄像头已输出目标分辨率时跳过resize
+                # 例外：源图比目标小 (需要放大) 时先转灰度，放大只需处理单通道
+                if not use_color and frame.ndim == 3 and frame.shape[0] * frame.shape[1] < frame_pixels:
+                    frame = cvt_color(frame, color_bgr2gray)
+                
+                if frame.shape[:2] != frame_shape:
+                    interpolation = resize_interpolation(frame, *frame_size)
+                    if use_color or frame.ndim == 2:
+                        dst = acquire(frame_shape + frame.shape[2:])
                     else:
-                        # 帧率足够，提高质量
-                        self.current_quality = min(70, self.current_quality + 2)
-                        print(f"📈 Improve quality: Q{self.current_quality}")
-            
-            # 🌐 Wireless mode smart adjustment strategy
-            elif self.transmission_mode == 'wireless':
-                # Wireless mode: More relaxed packet size limits, more aggressive optimization
-                target_fps = 1.0 / self.current_fps_delay  # Target frame rate
+                        dst = resized_buf  # 之后还要转灰度，写入中间缓冲区
+                    frame = resize(frame, frame_size, dst=dst, interpolation=interpolation)
                 
-                # Mainly adjust based on frame rate and success rate, packet size as secondary factor
-                if success_rate < 0.9 or recent_fps < target_fps * 0.7:
-                    # Insufficient performance, reduce quality
-                    self.current_quality = max(25, self.current_quality - 2)
-                    # Don't easily increase delay in wireless mode
-                    if success_rate < 0.8:
-                        self.current_fps_delay = min(self.current_fps_delay * 1.2, 0.1)
-                    print(f"🌐 Wireless optimization - Reduce quality: Q{self.current_quality} (Target FPS:{target_fps:.0f}fps)")
-                elif success_rate > 0.98 and recent_fps > target_fps * 0.9 and avg_packet_size < self.target_packet_size * 1.5:
-                    # Good performance, can improve quality
-                    max_quality = 85  # Wireless mode allows higher quality
-                    self.current_quality = min(max_quality, self.current_quality + 1)
-                    # Try to improve frame rate
-                    self.current_fps_delay = max(0.01, self.current_fps_delay * 0.95)
-                    print(f"🌐 Wireless optimization - Improve quality: Q{self.current_quality}")
-            else:
-                # UART mode: Original conservative adjustment strategy
-                if success_rate < 0.8 or avg_packet_size > self.target_packet_size * 1.2:
-                    # Reduce quality
-                    self.current_quality = max(20, self.current_quality - 3)
-                    self.current_fps_delay = min(0.2, self.current_fps_delay + 0.01)
-                    print(f"📉 Reduce quality: Q{self.current_quality}")
-                elif success_rate > 0.95 and avg_packet_size < self.target_packet_size * 0.8:
-                    # Improve quality
-                    max_quality = 80 if self.performance_mode == "high_quality" else 60
-                    self.current_quality = min(max_quality, self.current_quality + 2)
-                    self.current_fps_delay = max(0.02, self.current_fps_delay - 0.005)
-                    print(f"📈 Improve quality: Q{self.current_quality}")
-            
-            print(f"📊 Send status: Q={self.current_quality}, Compression={avg_compression:.1f}x, "
-                  f"Packet size={avg_packet_size:.0f}B, FPS={recent_fps:.1f}fps, "
-                  f"Success rate={success_rate:.2%}")
+                # 根据配置决定是否转换为灰度图 (摄像头已直接输出灰度图时跳过)
+                if not use_color and frame.ndim == 3:
+                    frame = cvt_color(frame, color_bgr2gray, dst=acquire(frame_shape))
+                
+                put_frame(frame)
+                
+            except Exception as e:
+                print_throttled('capture', f"❌ Capture thread error: {e}")
+                time.sleep(0.1)
+    
+    def encode_thread(self):
+        """Encode thread - pace frames and WebP-encode them for the sender"""
+        print("🎨 Encode thread started")
+        
+        # 热路径上用到的属性/函数绑定为局部变量
+        get_frame = self._capture_queue.get
+        put_encoded = self._send_queue.put
+        recycle = self._recycle_frame
+        encode = self.encode_frame_webp
+        resize = cv2.resize
+        monotonic = time.monotonic
+        sleep = time.sleep
+        controller = self.wireless_controller
+        
+        # 受速率限制的链路每秒能发送的字节数 (UART按8N1每字节10位；限速的无线按令牌桶补充速率)
+        if self.transmission_mode == 'uart':
+            link_bytes_per_second = self.baud_rate / 10
+        elif self._transmit == self._transmit_wireless_paced:
+            link_bytes_per_second = self.wireless_controller.fill_rate
+        else:
+            link_bytes_per_second = None  # 不限速
+        
+        # 重复帧检测用的1/8缩略图尺寸
+        thumb_size = (max(1, self.frame_width // 8), max(1, self.frame_height // 8))
+        
+        # 基于截止时间的帧调度：编码/发送耗时计入帧周期，避免帧率漂移
+        next_deadline = monotonic()
+        
+        # 链路持续失败期间连续跳过的帧数 (每k帧仍编码一帧用于探测链路是否恢复)
+        failing_skipped = 0
+        
+        while self.running:
+            try:
+                # 取最新的一帧，排队中更旧的帧直接回收
+                frame = get_frame(timeout=0.1, latest=True)
+                if frame is None:
+                    continue
+                
+                # 链路拥塞时直接丢弃本帧 (发送前反正要等待)，不浪费时间编码过时的画面
+                if controller is not None and controller.is_congested(self.target_packet_size):
+                    self.stats['frames_dropped'] += 1
+                    encoded_data = None
+                elif failing_skipped < MK_FIRM_WINDOW - 1 and self._link_failing():
+                    # 发送端持续出错，编码出来也发不出去，省下编码的CPU留给恢复
+                    failing_skipped += 1
+                    self.stats['frames_dropped'] += 1
+                    encoded_data = None
+                else:
+                    failing_skipped = 0
+                    # 与上一次编码的帧几乎相同、且编码参数未变时直接重发缓存的编码数据
+                    # (与上一编码帧而不是上一帧比较，缓慢变化不会被逐帧累积忽略)
+                    # 区域平均缩略图压低传感器噪声，同时局部的小变化仍会反映在对应像素上
+                    # 质量或method被调整后必须重新编码，否则静止画面下调整不起作用
+                    settings = (int(self.current_quality), self.webp_method)
+                    thumb = None
+                    if SKIP_DUPLICATE_FRAMES:
+                        thumb = resize(frame, thumb_size, interpolation=cv2.INTER_AREA)
+                    if (thumb is not None and self._prev_encoded is not None and
+                            settings == self._prev_settings and
+                            cv2.norm(thumb, self._prev_thumb, cv2.NORM_INF) <= DUPLICATE_FRAME_THRESHOLD):
+                        encoded_data = self._prev_encoded
+                        self.stats['frames_repeated'] += 1
+                    else:
+                        # WebP encoding
+                        encoded_data = encode(frame)
+                        
+                        # 单帧在链路上的传输时间超过帧周期的1.3倍时不发送，记为失败并立即调整质量，
+                        # 不等每20帧一次的调整，避免过大的帧堆积延迟
+                        # (只判断新编码的帧；质量已在下限时仍然发送，否则画面会完全中断)
+                        if (encoded_data and link_bytes_per_second and
+                                len(encoded_data) > link_bytes_per_second * self.current_fps_delay * 1.3 and
+                                self.current_quality > self._quality_range()[0]):
+                            print_throttled('oversize', f"⚠️ Dropped {len(encoded_data)}B frame "
+                                            f"(exceeds link budget at Q{settings[0]})")
+                            with self._stats_lock:
+                                self.failed_frames += 1
+                                self._record_frame(len(encoded_data), False)
+                                self.adjust_quality_smart(oversized_size=len(encoded_data))
+                            encoded_data = None
+                        
+                        if encoded_data and thumb is not None:
+                            self._prev_encoded = encoded_data
+                            self._prev_thumb = thumb
+                            self._prev_settings = settings
+                
+                recycle(frame)
+                if encoded_data:
+                    put_encoded(encoded_data)
+                
+                # 等待到下一帧的截止时间 (current_fps_delay可能被质量调整修改，每帧重新读取)
+                next_deadline += self.current_fps_delay
+                slack = next_deadline - monotonic()
+                if slack > 0:
+                    sleep(slack)
+                else:
+                    # 已落后于计划，重新同步，避免连续突发补帧
+                    next_deadline = monotonic()
+                
+            except Exception as e:
+                print_throttled('encode', f"❌ Encode thread error: {e}")
+                self.error_count += 1
+                time.sleep(0.1)
     
     def sender_thread(self):
-        """Sender thread"""
+        """Sender thread - transmit encoded frames and track statistics"""
         print("🚀 WebP sender thread started")
-        last_fps_time = time.time()
+        
+        # 热路径上用到的属性/函数绑定为局部变量，避免每帧重复的属性查找
+        get_encoded = self._send_queue.get
+        send = self.send_packet
+        record_frame = self._record_frame
+        stats_lock = self._stats_lock
+        monotonic = time.monotonic
+        fps_history = self.stats['fps_history']
+        high_speed = self.baud_rate >= 1000000
+        
+        last_fps_time = monotonic()
         frame_count_for_fps = 0
         bytes_sent_for_bps = 0
         
         # 高速模式统计
-        if self.baud_rate >= 1000000:
+        if high_speed:
             print("📊 Performance monitoring enabled")
-            last_perf_print = time.time()
+            last_perf_print = monotonic()
             frames_sent_perf = 0
             bytes_sent_perf = 0
         
         while self.running:
             try:
                 # Check error recovery
-                if time.time() - self.last_successful_time > 2.0 or self.error_count > 5:
+                if monotonic() - self.last_successful_time > 2.0 or self.error_count > 5:
                     self.enter_recovery_mode()
                 elif self.recovery_mode and self.error_count == 0:
                     self.exit_recovery_mode()
                 
-                # Capture frame
-                ret, frame = self.cap.read()
-                if not ret:
-                    time.sleep(0.01)
+                # 按编码顺序取出下一帧
+                encoded_data = get_encoded(timeout=0.1)
+                if encoded_data is None:
                     continue
                 
-                # 根据配置决定是否转换为灰度图
-                if self.transmission_mode in ['wireless', 'hybrid'] and self.use_color:
-                    # 无线模式使用彩色图像
-                    frame_resized = cv2.resize(frame, (self.frame_width, self.frame_height))
-                    # 如果需要进行颜色空间转换，例如BGR转RGB
-                    # frame_resized = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-                else:
-                    # 有线UART模式或设置为灰度图
-                    frame_resized = cv2.resize(frame, (self.frame_width, self.frame_height))
-                    frame_resized = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2GRAY)
-                
-                # WebP encoding
-                encoded_data = self.encode_frame_webp(frame_resized)
+                encoded_size = len(encoded_data)
                 
-                if encoded_data:
-                    # 性能监控
-                    if self.baud_rate >= 1000000:
-                        current_time = time.time()
-                        
-                    # Send
-                    if self.send_packet(encoded_data):
-                        self.frame_counter += 1
-                        self.successful_frames += 1
-                        frame_count_for_fps += 1
-                        bytes_sent_for_bps += len(encoded_data)
-                        
-                        # 高速模式性能监控
-                        if self.baud_rate >= 1000000:
-                            frames_sent_perf += 1
-                            bytes_sent_perf += len(encoded_data)
-                            
-                            # 每5秒打印一次性能信息
-                            if current_time - last_perf_print >= 5.0:
-                                elapsed = current_time - last_perf_print
-                                fps = frames_sent_perf / elapsed
-                                bps = bytes_sent_perf * 8 / elapsed
-                                utilization = (bps / self.baud_rate) * 100
-                                print(f"⚡ Performance: {fps:.1f} fps, {bps/1000:.0f} kbps ({utilization:.1f}% of {self.baud_rate/1000:.0f}K)")
-                                frames_sent_perf = 0
-                                bytes_sent_perf = 0
-                                last_perf_print = current_time
-                        
-                        self.last_successful_time = time.time()
-                        self.error_count = 0
-                        
-                        # Record statistics
-                        self.frame_buffer.append({
-                            'id': self.frame_counter,
-                            'size': len(encoded_data),
-                            'time': time.time(),
-                            'success': True
-                        })
+                # Send
+                if send(encoded_data):
+                    # 发送完成后只取一次时间，性能监控、成功时间和帧率统计共用
+                    current_time = monotonic()
+                    self.frame_counter += 1
+                    self.successful_frames += 1
+                    frame_count_for_fps += 1
+                    bytes_sent_for_bps += encoded_size
+                    
+                    # 高速模式性能监控
+                    if high_speed:
+                        frames_sent_perf += 1
+                        bytes_sent_perf += encoded_size
                         
-                        # Calculate frame rate
-                        current_time = time.time()
-                        if current_time - last_fps_time >= 1.0:
-                            fps = frame_count_for_fps / (current_time - last_fps_time)
-                            self.stats['fps_history'].append(fps)
-                            last_fps_time = current_time
-                            frame_count_for_fps = 0
-                    else:
+                        # 每5秒打印一次性能信息
+                        if current_time - last_perf_print >= 5.0:
+                            elapsed = current_time - last_perf_print
+                            fps = frames_sent_perf / elapsed
+                            bps = bytes_sent_perf * 8 / elapsed
+                            utilization = (bps / self.baud_rate) * 100
+                            print(f"⚡ Performance: {fps:.1f} fps, {bps/1000:.0f} kbps ({utilization:.1f}% of {self.baud_rate/1000:.0f}K)")
+                            frames_sent_perf = 0
+                            bytes_sent_perf = 0
+                            last_perf_print = current_time
+                    
+                    self.last_successful_time = current_time
+                    self.error_count = 0
+                    
+                    # Record statistics
+                    with stats_lock:
+                        record_frame(encoded_size, True)
+                    
+                    # Calculate frame rate
+                    if current_time - last_fps_time >= 1.0:
+                        fps = frame_count_for_fps / (current_time - last_fps_time)
+                        fps_history.append(fps)
+                        last_fps_time = current_time
+                        frame_count_for_fps = 0
+                else:
+                    with stats_lock:
                         self.failed_frames += 1
+                        record_frame(encoded_size, False)
                 
-                # Smart quality adjustment
-                if self.frame_counter % 20 == 0:
-                    self.adjust_quality_smart()
-                
-                time.sleep(self.current_fps_delay)
+                # Smart quality adjustment - 每记录20帧(含失败帧)调整一次
+                # (按frame_counter判断时，发送失败或丢帧期间计数不变，会每次循环都触发)
+                if self._fb_count % 20 == 0:
+                    with stats_lock:
+                        self.adjust_quality_smart()
                 
             except Exception as e:
-                print(f"❌ Sender thread error: {e}")
+                print_throttled('send', f"❌ Sender thread error: {e}")
                 self.error_count += 1
                 time.sleep(0.1)
     
@@ -1138,7 +1738,18 @@ class WebPSender:
         
         self.running = True
         
-        # Start sender thread
+        # 提高计时器精度，发送节奏控制中的毫秒级sleep才会准确
+        self._timer_resolution_set = set_timer_resolution(True)
+        
+        # Start pipeline threads: capture → encode → send
+        self.capture_thread_obj = threading.Thread(target=self.capture_thread)
+        self.capture_thread_obj.daemon = True
+        self.capture_thread_obj.start()
+        
+        self.encode_thread_obj = threading.Thread(target=self.encode_thread)
+        self.encode_thread_obj.daemon = True
+        self.encode_thread_obj.start()
+        
         self.sender_thread_obj = threading.Thread(target=self.sender_thread)
         self.sender_thread_obj.daemon = True
         self.sender_thread_obj.start()
@@ -1146,6 +1757,7 @@ class WebPSender:
         # Start handshake thread for hybrid mode
         if self.transmission_mode == 'hybrid':
             self.handshake_running = True
+            self._handshake_stop.clear()
             self.handshake_thread = threading.Thread(target=self.handshake_thread_func)
             self.handshake_thread.daemon = True
             self.handshake_thread.start()
@@ -1156,19 +1768,22 @@ class WebPSender:
         print("📊 Performance mode: " + self.mode_description)
         print("📷 Camera resolution: " + str(self.frame_width) + "x" + str(self.frame_height))
         print("🔄 Transmission mode: " + self.transmission_mode.upper())
+        if self.transmission_mode != 'uart':
+            print("📡 Wireless transport: " + self.wireless_transport.upper())
         
         return True
     
     def print_stats(self):
         """Print statistics"""
         success_rate = self.successful_frames / max(1, self.successful_frames + self.failed_frames)
-        avg_compression = np.mean(list(self.stats['compression_ratios'])) if self.stats['compression_ratios'] else 1.0
-        avg_packet_size = np.mean(list(self.stats['packet_sizes'])) if self.stats['packet_sizes'] else 0
-        current_fps = np.mean(list(self.stats['fps_history'])[-5:]) if len(self.stats['fps_history']) >= 5 else 0
+        avg_compression = self.stats['compression_ratios'].mean if self.stats['compression_ratios'] else 1.0
+        avg_packet_size = self.stats['packet_sizes'].mean
+        current_fps = self.stats['fps_history'].mean if len(self.stats['fps_history']) >= 5 else 0
         
         print(f"📊 Send statistics - Mode:{self.performance_mode} Q:{self.current_quality} "
               f"Compression:{avg_compression:.1f}x FPS:{current_fps:.1f}fps "
               f"Packet size:{avg_packet_size:.0f}B Sent:{self.stats['frames_sent']} "
+              f"Dropped:{self.stats['frames_dropped']} Repeated:{self.stats['frames_repeated']} "
               f"Success rate:{success_rate:.1%} Status:{'Recovery' if self.recovery_mode else 'Normal'}")
     
     def stop(self):
@@ -1179,22 +1794,39 @@ class WebPSender:
         # Stop handshake thread for hybrid mode
         if self.transmission_mode == 'hybrid' and self.handshake_running:
             self.handshake_running = False
+            self._handshake_stop.set()
             if self.handshake_thread:
                 self.handshake_thread.join(timeout=1.0)
         
-        # Stop sender thread
-        if hasattr(self, 'sender_thread_obj') and self.sender_thread_obj.is_alive():
-            self.sender_thread_obj.join(timeout=1.0)
+        # Stop pipeline threads
+        for name in ('capture_thread_obj', 'encode_thread_obj', 'sender_thread_obj'):
+            thread = getattr(self, name, None)
+            if thread is not None and thread.is_alive():
+                thread.join(timeout=1.0)
+        
+        if getattr(self, '_timer_resolution_set', False):
+            set_timer_resolution(False)
+            self._timer_resolution_set = False
         
         # Release camera
         if self.cap is not None:
             self.cap.release()
+        if self.capture_process is not None:
+            self._stop_capture_process()
         
         # Close serial port
         if self.ser_sender is not None:
+            try:
+                # 关闭前等待剩余数据发送完毕
+                if self.ser_sender.is_open:
+                    self.ser_sender.flush()
+            except Exception:
+                pass
             self.ser_sender.close()
         
         # Close wireless socket
+        if self._write_selector is not None:
+            self._write_selector.close()
         if self.wireless_socket is not None:
             self.wireless_socket.close()
         
@@ -1211,9 +1843,13 @@ def main():
     
     # Select transmission mode
     transmission_mode, baud_rate = select_transmission_mode()
+    wireless_transport = None
+    if transmission_mode != 'uart':
+        wireless_transport = select_wireless_transport()
     
     # Create WebP sender
-    sender = WebPSender(transmission_mode=transmission_mode, baud_rate=baud_rate)
+    sender = WebPSender(transmission_mode=transmission_mode, baud_rate=baud_rate,
+                        wireless_transport=wireless_transport)
     
     # Start transmission
     if not sender.start():